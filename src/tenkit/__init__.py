@@ -1 +1 @@
-from . import base, metrics, utils, decomposition
\ No newline at end of file
+from . import base, metrics, utils, ragged, decomposition
\ No newline at end of file
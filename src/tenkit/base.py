@@ -36,11 +36,21 @@ def orthogonal_rightsolve(A, B):
 def orthogonal_solve(A, B):
     """Solve the equation AX = B wrt X with orthogonality on X
     """
-    U, S, Vh = np.linalg.svd(B.T@A, full_matrices=False)
-    S_tol = max(U.shape) * S[0] * (1e-16)
+    return orthogonal_solve_from_cross_product(B.T@A)
+
+
+def orthogonal_solve_from_cross_product(BtA):
+    """Solve the equation AX = B wrt X with orthogonality on X, given the product B^T A.
+
+    Useful when the cross product can be computed more efficiently than
+    by forming A and B explicitly. If BtA is a stack of matrices (a three-way
+    array), then one problem is solved for each matrix in the stack.
+    """
+    U, S, Vh = np.linalg.svd(BtA, full_matrices=False)
+    S_tol = max(U.shape[-2:]) * S[..., :1] * (1e-16)
     should_keep = (S > S_tol).astype(float)
 
-    return (Vh.T * should_keep)@ U.T
+    return (np.swapaxes(Vh, -1, -2) * should_keep[..., np.newaxis, :]) @ np.swapaxes(U, -1, -2)
 
 
 def add_rightsolve_ridge(rightsolve, ridge_penalty):
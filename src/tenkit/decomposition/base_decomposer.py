@@ -80,16 +80,22 @@ class BaseDecomposer(ABC):
     def reconstructed_X(self):
         pass
     
-    def set_target(self, X):
+    def set_target(self, X, X_norm=None):
         """Set target for fitting of model.
 
         Arguments
         ---------
         X : np.ndarray
             The tensor to fit the model to
+        X_norm : float (optional)
+            The Frobenius norm of X. If None, then it is computed from X.
+            Useful when X is a buffer that is updated in place by another
+            decomposer that already knows its norm.
         """
         self.X = X
-        self.X_norm = np.linalg.norm(X)
+        if X_norm is None:
+            X_norm = np.linalg.norm(X)
+        self.X_norm = X_norm
 
     @property
     def explained_variance(self):
@@ -1,13 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import h5py
 import numpy as np
-from .cp import CP_ALS
+import scipy.linalg
+import scipy.optimize
+import scipy.sparse
+from .cp import BaseCP, CP_ALS
 
 from ..base import unfold
 from .. import base
 
 
+__all__ = ['CMTF_ALS', 'CMTF_OPT']
+
+
+def _squared_norm(Y):
+    """Squared Frobenius norm of a dense or sparse matrix.
+    """
+    if scipy.sparse.issparse(Y):
+        return np.vdot(Y.data, Y.data)
+    return np.linalg.norm(Y)**2
+
 
-class CMTF_ALS(CP_ALS): 
+class BaseCMTF(BaseCP):
+    """Base class for coupled matrix and tensor factorisation (CMTF) decomposers.
+
+    Contains the coupled matrices, the loss and the initialisation of the 
+    uncoupled factor matrices, which are shared by all fitting algorithms.
+    """
     def store_checkpoint(self):
         #TODO: store the matrices as well
         with h5py.File(self.checkpoint_path, 'a') as h5:
@@ -31,17 +51,57 @@ class CMTF_ALS(CP_ALS):
 
     @property
     def coupled_factor_matrices_SSE(self):
-        SSE = 0
+        r"""Sum squared error of the coupled matrices, computed without reconstructing them.
+
+        Uses that 
 
-        for Y, reconstructed_Y in zip(self.coupled_matrices, self.reconstructed_coupled_matrices):
-            SSE += np.linalg.norm(Y - reconstructed_Y)**2
+        .. math::
+
+            \|Y - U V^T\|^2 = \|Y\|^2 + \langle U^T U, V^T V \rangle - 2 \langle V, Y^T U \rangle,
+
+        where :math:`Y^T U` is cached when :math:`V` is updated.
+        """
+        SSE = 0
+        for cm_idx, (Y, mode) in enumerate(zip(self.coupled_matrices, self.coupling_modes)):
+            U = self.factor_matrices[mode]
+            V = self.uncoupled_factor_matrices[cm_idx]
+            YtU = self._coupled_cross_product_cache[cm_idx]
+            if YtU is None:
+                YtU = Y.T@U
+
+            SSE += self.coupled_matrices_sq_norms[cm_idx] + np.sum((U.T@U)*(V.T@V)) - 2*np.sum(V*YtU)
         return SSE
+
+    @property
+    def tensor_SSE(self):
+        r"""Sum squared error of the tensor, computed without reconstructing it.
+
+        Uses that
+
+        .. math::
+
+            \|\mathcal{X} - [[U_0, ..., U_N]]\|^2 = \|\mathcal{X}\|^2 + \mathbf{w}^T (U_0^T U_0 * ... * U_N^T U_N) \mathbf{w}
+                - 2 \mathbf{w}^T \text{diag}(U_n^T M_n),
+
+        where :math:`M_n` is the MTTKRP of the last updated mode, :math:`n`, which is cached.
+        """
+        weights = self.weights
+        gram_product = np.ones((self.rank, self.rank))
+        for factor_matrix in self.factor_matrices:
+            gram_product *= factor_matrix.T@factor_matrix
+
+        mode, mttkrp = self._last_updated_mode, self._mttkrp_cache
+        if mttkrp is None:
+            mode = 0
+            mttkrp = base.matrix_khatri_rao_product(self.X, self.factor_matrices, mode)
+        inner_product = np.sum(weights*np.sum(self.factor_matrices[mode]*mttkrp, axis=0))
+
+        return self.X_norm**2 + weights@gram_product@weights - 2*inner_product
     
     @property
     def SSE(self):
         """Sum Squared Error"""
-        # TODO: Cache result
-        return np.linalg.norm(self.X - self.reconstructed_X)**2 + self.coupled_factor_matrices_SSE
+        return self.tensor_SSE + self.coupled_factor_matrices_SSE
 
     @property
     def MSE(self):
@@ -59,10 +119,28 @@ class CMTF_ALS(CP_ALS):
         return self.SSE  # TODO: skal det være property?
 
     def set_coupled_matrices(self, coupled_matrices, coupling_modes):
+        # Sparse matrices are stored in CSR format (without duplicate entries), so that the
+        # products with the factor matrices and the norms cost time proportional to the nonzeros
+        coupled_matrices = [
+            scipy.sparse.csr_matrix(Y) if scipy.sparse.issparse(Y) else Y for Y in coupled_matrices
+        ]
+        for Y in coupled_matrices:
+            if scipy.sparse.issparse(Y):
+                Y.sum_duplicates()
         self.coupled_matrices = coupled_matrices
         self.coupling_modes = coupling_modes
         self._set_mode_to_coupled_matrix_mapping(coupling_modes)
 
+        self.coupled_matrices_sq_norms = [_squared_norm(Y) for Y in coupled_matrices]
+        self._clear_loss_cache()
+
+    def _clear_loss_cache(self):
+        """Clear the cached MTTKRP and cross products, which must be done if the factors are rescaled.
+        """
+        self._last_updated_mode = None
+        self._mttkrp_cache = None
+        self._coupled_cross_product_cache = [None]*len(self.coupled_matrices)
+
     def _set_mode_to_coupled_matrix_mapping(self, coupling_modes):
         mode_to_cm_idx = {}
 
@@ -73,24 +151,13 @@ class CMTF_ALS(CP_ALS):
                 mode_to_cm_idx[cm] = [i]
         self.mode_to_cm_idx = mode_to_cm_idx
     
-    def _init_fit(self, X, coupled_matrices, coupling_modes, max_its, initial_decomposition):
-        self.set_coupled_matrices(coupled_matrices, coupling_modes)
-        super()._init_fit(X=X, max_its=max_its, initial_decomposition=initial_decomposition)
-        self._rel_function_change = np.inf
-        self.prev_SSE = self.SSE
-        
-        self.decomposition.normalize_components()
-
-    def _fit(self):
-        super()._fit()
-        self._normalize_components()
-    
     def _normalize_components(self):
         for uncoupled_matrix, coupling_mode in zip(self.uncoupled_factor_matrices, self.coupling_modes):
             fm = self.decomposition.factor_matrices[coupling_mode]
             uncoupled_matrix[...] = uncoupled_matrix*np.linalg.norm(fm, axis=0, keepdims=True)
         
         self.decomposition.normalize_components()
+        self._clear_loss_cache()
 
    
     def fit(self, X, coupled_matrices, coupling_modes, y=None, *, max_its=None, initial_decomposition=None):
@@ -100,8 +167,8 @@ class CMTF_ALS(CP_ALS):
         ----------
         X : np.ndarray
             The tensor to fit
-        coupled_matrices: list(np.ndarray)
-            Matrices to fit
+        coupled_matrices: list(np.ndarray or scipy.sparse.spmatrix)
+            Matrices to fit. Sparse matrices are never densified.
         coupling_modes: list(int)
             Modes to couple along
         y : None
@@ -127,8 +194,8 @@ class CMTF_ALS(CP_ALS):
         ----------
         X : np.ndarray
             The tensor to fit
-        coupled_matrices: list(np.ndarray)
-            Matrices to fit
+        coupled_matrices: list(np.ndarray or scipy.sparse.spmatrix)
+            Matrices to fit. Sparse matrices are never densified.
         coupling_modes: list(int)
             Modes to couple along
         y : None
@@ -143,167 +210,379 @@ class CMTF_ALS(CP_ALS):
                  y=y, max_its=max_its, initial_decomposition=initial_decomposition)
         return self.decomposition, [[A,V] for A, V in zip(self.coupled_factor_matrices, self.uncoupled_factor_matrices)]
 
+    def _init_coupled_matrices(self):
+        self.uncoupled_factor_matrices = [None]*len(self.coupling_modes)
+        self.coupled_weights = [None]*len(self.coupling_modes)
+
+        for i, mode in enumerate(self.coupling_modes):
+            num_rows = self.coupled_matrices[i].shape[1]
+            uncoupled_factor_matrix = self._random_uncoupled_factor_matrix(num_rows, mode)
+            self.uncoupled_factor_matrices[i] = uncoupled_factor_matrix/np.linalg.norm(uncoupled_factor_matrix, axis=0)
+            self.coupled_weights[i] = np.ones((self.rank,))
+
+    def _random_uncoupled_factor_matrix(self, num_rows, mode):
+        return np.random.randn(num_rows, self.rank)
+
+    def init_components(self, initial_decomposition=None):
+        super().init_components(initial_decomposition=initial_decomposition)
+        self._init_coupled_matrices()
+
+
+class CMTF_ALS(BaseCMTF, CP_ALS):
+    r"""Coupled matrix and tensor factorisation (CMTF) using Alternating Least Squares.
+
+    Takes the same arguments as ``CP_ALS``, and in addition:
+
+    Arguments:
+    ----------
+    n_threads: int (optional, default=1)
+        Number of threads used to compute the contributions of the coupled
+        matrices. Several matrices can be coupled to the same mode, and their
+        contributions to the normal equations of that mode, as well as the
+        updates of their uncoupled factor matrices, are independent. 
+        If 1, then no thread pool is used.
+    """
+    def __init__(
+        self,
+        rank,
+        max_its=1000,
+        convergence_tol=1e-6,
+        rel_loss_tol=1e-10,
+        init='random',
+        loggers=None,
+        checkpoint_frequency=None,
+        checkpoint_path=None,
+        print_frequency=None,
+        non_negativity_constraints=None,
+        ridge_penalties=None,
+        orthonormality_constraints=None,
+        n_threads=1,
+    ):
+        super().__init__(
+            rank=rank,
+            max_its=max_its,
+            convergence_tol=convergence_tol,
+            rel_loss_tol=rel_loss_tol,
+            init=init,
+            loggers=loggers,
+            checkpoint_frequency=checkpoint_frequency,
+            checkpoint_path=checkpoint_path,
+            print_frequency=print_frequency,
+            non_negativity_constraints=non_negativity_constraints,
+            ridge_penalties=ridge_penalties,
+            orthonormality_constraints=orthonormality_constraints,
+        )
+        self.n_threads = n_threads
+
+    def _init_fit(self, X, coupled_matrices, coupling_modes, max_its, initial_decomposition):
+        self.set_coupled_matrices(coupled_matrices, coupling_modes)
+        super()._init_fit(X=X, max_its=max_its, initial_decomposition=initial_decomposition)
+        self._rel_function_change = np.inf
+        self.prev_SSE = self.SSE
+        
+        self.decomposition.normalize_components()
+
+    def _fit(self):
+        super()._fit()
+        self._normalize_components()
+    
     def _update_als_factors(self):
         num_modes = len(self.X.shape) # TODO: Should this be cashed?
         for mode in range(num_modes):
-            if self.non_negativity_constraints[mode]:
-                self._update_als_factor_non_negative(mode) 
-            else:
-                self._update_als_factor(mode)
+            # Non negativity constraints are imposed by the rightsolve of CP_ALS
+            self._update_als_factor(mode)
         self._update_uncoupled_matrix_factors()
 
+    def _map_coupled_matrices(self, function, cm_indices):
+        """Returns ``[function(cm_idx) for cm_idx in cm_indices]``, computed in parallel if ``n_threads > 1``.
+        """
+        if self.n_threads is None or self.n_threads <= 1 or len(cm_indices) <= 1:
+            return [function(cm_idx) for cm_idx in cm_indices]
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            return list(executor.map(function, cm_indices))
+
     def _get_als_lhs(self, mode):
-        if mode in self.mode_to_cm_idx:
-            khatri_rao_product= base.khatri_rao(*self.factor_matrices, skip=mode)
-            V = [self.uncoupled_factor_matrices[cm_idx] for cm_idx in self.mode_to_cm_idx[mode]][0]
-            return np.concatenate([khatri_rao_product, V], axis=0).T
-        else:
-            return super()._get_als_lhs(mode)
+        r"""Compute the left hand side of the normal equations.
+
+        For a coupled mode, each coupled matrix, :math:`Y_i \approx U V_i^T`, adds 
+        :math:`V_i^T V_i` to the Hadamard product of the Gram matrices.
+        """
+        lhs = super()._get_als_lhs(mode)
+        for cm_idx in self.mode_to_cm_idx.get(mode, []):
+            V = self.uncoupled_factor_matrices[cm_idx]
+            lhs = lhs + V.T@V
+        return lhs
     
     def _get_als_rhs(self, mode):
-        if mode in self.mode_to_cm_idx:
-            unfolded_X = base.unfold(self.X, mode)
-            coupled_Y = [self.coupled_matrices[cm_idx] for cm_idx in self.mode_to_cm_idx[mode]][0]
+        r"""Compute the right hand side of the normal equations.
 
-            return np.concatenate([unfolded_X, coupled_Y], axis=1)
-        else:
-            return super()._get_als_rhs(mode)
+        For a coupled mode, each coupled matrix, :math:`Y_i \approx U V_i^T`, adds 
+        :math:`Y_i V_i` to the MTTKRP.
+        """
+        # The MTTKRP is cached for the loss (the rhs is cached by CP_ALS, but 
+        # that includes the coupled matrices)
+        rhs = super()._get_als_rhs(mode)
+        self._mttkrp_cache = rhs
+        cm_indices = self.mode_to_cm_idx.get(mode, [])
+        products = self._map_coupled_matrices(
+            lambda cm_idx: self.coupled_matrices[cm_idx]@self.uncoupled_factor_matrices[cm_idx], cm_indices
+        )
+        for product in products:
+            rhs = rhs + product
 
+        # The cached cross products are outdated once this mode is updated
+        for cm_idx in cm_indices:
+            self._coupled_cross_product_cache[cm_idx] = None
+        return rhs
 
     def _update_uncoupled_matrix_factors(self):
-        for mode, cm_idx in self.mode_to_cm_idx.items():
-            cm_idx = self.mode_to_cm_idx[mode][0]
-            
-            lhs = self.factor_matrices[mode].T
-            rhs = self.coupled_matrices[cm_idx].T
+        self._map_coupled_matrices(self._update_uncoupled_matrix_factor, range(len(self.coupled_matrices)))
 
-            if self.non_negativity_constraints is None:
-                self.uncoupled_factor_matrices[cm_idx][...] = base.rightsolve(lhs, rhs)
+    def _update_uncoupled_matrix_factor(self, cm_idx):
+        mode = self.coupling_modes[cm_idx]
+        U = self.factor_matrices[mode]
+        Y = self.coupled_matrices[cm_idx]
+        YtU = Y.T@U
 
-            if self.non_negativity_constraints[mode]:
-                new_fm = base.non_negative_rightsolve(lhs, rhs)
-                self.uncoupled_factor_matrices[cm_idx][...] = new_fm
+        if self.non_negativity_constraints is not None and self.non_negativity_constraints[mode]:
+            if scipy.sparse.issparse(Y):
+                new_fm = self._sparse_non_negative_uncoupled_update(U, YtU)
             else:
-                self.uncoupled_factor_matrices[cm_idx][...] = base.rightsolve(lhs, rhs)
-
+                new_fm = base.non_negative_rightsolve(U.T, Y.T)
+            self.uncoupled_factor_matrices[cm_idx][...] = new_fm
+        else:
+            # Normal equations, V U^T U = Y^T U
+            self.uncoupled_factor_matrices[cm_idx][...] = base.rightsolve(U.T@U, YtU)
 
+        # Used to compute the loss until U is updated
+        self._coupled_cross_product_cache[cm_idx] = YtU
 
-    def _update_als_factor_(self, mode):
-        """Solve least squares problem to get factor for one mode."""
 
-        """        
-        for w in self.coupled_weights:
-            print('V weights:', w)
+    @staticmethod
+    def _sparse_non_negative_uncoupled_update(U, YtU):
+        r"""Non negative least squares update of V from the cross product :math:`Y^T U`.
 
-        for w in self.weights:
-            print('factor weights:', w)
+        With the Cholesky factorisation :math:`U^T U = L L^T`, we have that
+        :math:`\|U \mathbf{v} - \mathbf{y}\|^2 = \|L^T \mathbf{v} - L^{-1} U^T \mathbf{y}\|^2 + \text{const}`,
+        so the problem for each row of V is reduced to an :math:`R \times R` problem
+        and Y is never densified.
         """
+        L = np.linalg.cholesky(U.T@U)
+        return base.non_negative_rightsolve(L, scipy.linalg.solve_triangular(L, YtU.T, lower=True).T)
+
+    def _random_uncoupled_factor_matrix(self, num_rows, mode):
+        if self.non_negativity_constraints is not None and self.non_negativity_constraints[mode]:
+            return np.random.uniform(0, 1, (num_rows, self.rank))
+        return super()._random_uncoupled_factor_matrix(num_rows, mode)
+
+
+class CMTF_OPT(BaseCMTF):
+    r"""Coupled matrix and tensor factorisation (CMTF) using all-at-once optimisation.
+
+    The factor matrices of the tensor and the uncoupled factor matrices of the
+    coupled matrices are fitted jointly with L-BFGS or nonlinear conjugate gradients
+    (from ``scipy.optimize``) by minimising
+
+    .. math::
+
+        \|\mathcal{X} - [[U_0, ..., U_N]]\|^2 + \sum_i \|Y_i - U_{m_i} V_i^T\|^2,
+
+    where :math:`m_i` is the coupling mode of :math:`Y_i`. Neither the tensor nor
+    the coupled matrices are reconstructed to compute the loss and its gradient.
+
+    Arguments:
+    ----------
+    rank: int
+        Number of components.
+    max_its: int (optional, default=1000)
+        Maximum number of iterations (not function evaluations) of the optimiser.
+        Can be overwritten by the ``fit`` method.
+    convergence_tol: float (optional, default=1e-6)
+        Minimum relative function change between two consequetive
+        iterations for the model to continue fitting.
+    rel_loss_tol: float (optional, default=1e-10)
+        The fitting stops once the loss divided by the squared norm of the tensor
+        is below this value.
+    init: str (optional, default='random')
+        Initialisation method, either 'random', 'svd', 'from_checkpoint' or 'precomputed'.
+    logger: list(Logger) (optional, default=None)
+        List of loggers, each logger should implement a ``log`` method
+        that takes a decomposer as input and a ``write_to_hdf5_group``
+        method that stores the log in a hdf5 group. See 
+        ``tenkit.logging.BaseLogger`` for interface.
+    checkpoint_frequency: int (optional, default=None)
+        How often the decomposer should store the decomposition and
+        logs to disk. If None or negative, will only
+        checkpoint the last iteration. 
+    checkpoint_path: str or Path (optional, default=None)
+        Where to store the log HDF5 file. If None, then the checkpoints
+        and logs are not stored to disk.
+    print_frequency: int (optional, default=None)
+        How often convergence information should be printed in the terminal.
+        None and negative values leads to no printing.
+    method: str (optional, default='L-BFGS-B')
+        The optimiser to use, either 'L-BFGS-B' or 'CG' (nonlinear conjugate gradients).
+    gradient_tol: float (optional, default=1e-8)
+        The fitting stops once the largest absolute value of the gradient
+        is below this value.
+    """
+    def __init__(
+        self,
+        rank,
+        max_its=1000,
+        convergence_tol=1e-6,
+        rel_loss_tol=1e-10,
+        init='random',
+        loggers=None,
+        checkpoint_frequency=None,
+        checkpoint_path=None,
+        print_frequency=None,
+        method='L-BFGS-B',
+        gradient_tol=1e-8,
+    ):
+        super().__init__(
+            rank=rank,
+            max_its=max_its,
+            convergence_tol=convergence_tol,
+            rel_loss_tol=rel_loss_tol,
+            init=init,
+            loggers=loggers,
+            checkpoint_frequency=checkpoint_frequency,
+            checkpoint_path=checkpoint_path,
+            print_frequency=print_frequency,
+        )
+        if method not in {'L-BFGS-B', 'CG'}:
+            raise ValueError(f'Method must be either `L-BFGS-B` or `CG`, not {method}.')
+        self.method = method
+        self.gradient_tol = gradient_tol
 
-        debug = True
-        if debug:
-            from textwrap import dedent
-            debugstring = dedent(f"""\
-            
-            
-            Beginning of _update_als_factor mode {mode}
-
-                iteration: {self.current_iteration}
-                V weigths: {self.coupled_weights}
-                weights: {self.weights}
-                loss: {self.loss}
-                tensor loss: {np.linalg.norm(self.X - self.reconstructed_X)**2}
-                Y loss {self.coupled_factor_matrices_SSE}
-            """)
-            _loss = self.loss
-        
-
-
-
-        unfolded_X = base.unfold(self.X, mode)
-        khatri_rao_product= base.khatri_rao(*self.factor_matrices, skip=mode)
-
-
-        if mode in self.mode_to_cm_idx:
-
-            cm_idx = self.mode_to_cm_idx[mode][0]
-            
-            #self.coupled_weights[cm_idx][...] = np.linalg.norm(self.uncoupled_factor_matrices[cm_idx], axis=0)
-            #self.uncoupled_factor_matrices[cm_idx][...] = self.uncoupled_factor_matrices[cm_idx]/self.coupled_weights[cm_idx][np.newaxis]
-
-            # TODO: support multiple couplings for one mode
-            coupled_Y = [self.coupled_matrices[cm_idx] for cm_idx in self.mode_to_cm_idx[mode]][0]
-
-            concat_X = np.concatenate([unfolded_X, coupled_Y], axis=1)
-            V = [self.uncoupled_factor_matrices[cm_idx] for cm_idx in self.mode_to_cm_idx[mode]][0]
-            concat_b = np.concatenate([khatri_rao_product, V], axis=0).T 
+    def _init_fit(self, X, coupled_matrices, coupling_modes, max_its, initial_decomposition):
+        self.set_coupled_matrices(coupled_matrices, coupling_modes)
+        super()._init_fit(X=X, max_its=max_its, initial_decomposition=initial_decomposition)
+        self._rel_function_change = np.inf
+        self.prev_SSE = self.SSE
 
-            concat_X = self._get_als_rhs(mode)
-            concat_b = self._get_als_lhs(mode)
-            new_factor = concat_X @ np.linalg.pinv(concat_b)
+    @property
+    def _factor_sizes(self):
+        return [*self.X.shape, *(Y.shape[1] for Y in self.coupled_matrices)]
 
-            self.factor_matrices[mode][...] = new_factor
+    def _flatten_parameters(self):
+        return base.flatten_factors([*self.factor_matrices, *self.uncoupled_factor_matrices])
 
-            self.factor_matrices[mode][...] = self.factor_matrices[mode][...]/np.linalg.norm(self.factor_matrices[mode], axis=0)
+    def _set_parameters(self, parameters):
+        factors = base.unflatten_factors(parameters, self.rank, self._factor_sizes)
+        num_modes = len(self.X.shape)
+        for factor_matrix, new_factor_matrix in zip(self.factor_matrices, factors[:num_modes]):
+            factor_matrix[...] = new_factor_matrix
+        for uncoupled_factor_matrix, new_factor_matrix in zip(self.uncoupled_factor_matrices, factors[num_modes:]):
+            uncoupled_factor_matrix[...] = new_factor_matrix
+        self._clear_loss_cache()
 
+    def _loss_and_gradient(self, parameters):
+        r"""Compute the loss and its gradient for the flattened factor matrices.
 
+        With :math:`M_n` as the MTTKRP for mode :math:`n` and :math:`G_n = U_n^T U_n`, the
+        gradient of the tensor part of the loss with respect to :math:`U_n` is
 
-            #self.coupled_matrices[cm_idx][...] =  coupled_Y @ np.linalg.pinv(self.uncoupled_factor_matrices[mode]).T
-            self.uncoupled_factor_matrices[cm_idx][...] = coupled_Y.T @ np.linalg.pinv(self.factor_matrices[mode]).T
-        else:
-            """
-            concat_X = unfolded_X
-            concat_b = khatri_rao_product.T
+        .. math::
 
-            new_factor = concat_X @ np.linalg.pinv(concat_b)
+            2 (U_n (G_0 * ... * G_{n-1} * G_{n+1} * ... * G_N) - M_n),
 
-            self.factor_matrices[mode][...] = new_factor
-            """
-            V = self._compute_V(mode)
-            n = np.prod(V.shape)
+        and the gradients of :math:`\|Y_i - U V_i^T\|^2` with respect to :math:`U` and 
+        :math:`V_i` are :math:`2 (U V_i^T V_i - Y_i V_i)` and :math:`2 (V_i U^T U - Y_i^T U)`.
+        """
+        factors = base.unflatten_factors(parameters, self.rank, self._factor_sizes)
+        num_modes = len(self.X.shape)
+        factor_matrices, uncoupled_factor_matrices = factors[:num_modes], factors[num_modes:]
+        grams = [factor_matrix.T@factor_matrix for factor_matrix in factor_matrices]
+
+        gradients = []
+        for mode, factor_matrix in enumerate(factor_matrices):
+            gram_product = np.ones((self.rank, self.rank))
+            for other_mode, gram in enumerate(grams):
+                if other_mode != mode:
+                    gram_product *= gram
+
+            mttkrp = base.matrix_khatri_rao_product(self.X, factor_matrices, mode)
+            gradients.append(2*(factor_matrix@gram_product - mttkrp))
+
+        # The gram product and MTTKRP of the last mode gives the tensor part of the loss
+        loss = self.X_norm**2 + np.sum(gram_product*grams[-1]) - 2*np.sum(factor_matrix*mttkrp)
+
+        for cm_idx, (Y, mode) in enumerate(zip(self.coupled_matrices, self.coupling_modes)):
+            U = factor_matrices[mode]
+            V = uncoupled_factor_matrices[cm_idx]
+            VtV = V.T@V
+            YtU = Y.T@U
+
+            loss += self.coupled_matrices_sq_norms[cm_idx] + np.sum(grams[mode]*VtV) - 2*np.sum(V*YtU)
+            gradients[mode] += 2*(U@VtV - Y@V)
+            gradients.append(2*(V@grams[mode] - YtU))
+
+        # Reused by the callback, which only gets the parameters
+        self._last_evaluation = (parameters.copy(), loss)
+        return loss, base.flatten_factors(gradients)
+
+    def _loss_at(self, parameters):
+        """The loss for the flattened factor matrices, reused from the last evaluation if possible.
+        """
+        evaluated_parameters, loss = self._last_evaluation
+        if evaluated_parameters is not None and np.array_equal(parameters, evaluated_parameters):
+            return loss
+        return self._loss_and_gradient(parameters)[0]
 
-            _rhs = base.matrix_khatri_rao_product(self.X, self.factor_matrices, mode).T
-            # U, S, W = np.linalg.svd(V.T, full_matrices=False)
-            # new_factor = (W.T @ np.diag(1/(S + 1e-5)) @ U.T @ _rhs).T  #TODO er det denne måten vi vil gjøre det?
-            new_factor = (np.linalg.pinv(V.T) @ _rhs).T
-            _rhs = self._get_als_rhs(mode).T
-            V = self._get_als_lhs(mode)
-            new_factor = _rhs.T@np.linalg.pinv(V)
+    def _absorb_weights(self):
+        """Scale the first factor matrix by the weights, so that the parameters describe the full model.
+        """
+        self.factor_matrices[0][...] *= self.weights
+        self.decomposition.reset_weights()
+        self._clear_loss_cache()
 
-            self.factor_matrices[mode][...] = new_factor
-            #self.decomposition.normalize_components()
+    def _optimisation_callback(self, parameters):
+        """Called by ``scipy.optimize.minimize`` after each iteration.
 
-        
-        if debug:
-            debugstring += dedent(f"""\
-            end of update als factor (mode {mode})
-                loss: {self.loss})
-                tensor loss: {np.linalg.norm(self.X - self.reconstructed_X)**2})
-                Y loss: {self.coupled_factor_matrices_SSE}""")
-
-            if self.loss > _loss:
-                print(debugstring)
-            
-    
-    def _init_coupled_matrices(self):
-        self.uncoupled_factor_matrices = [None]*len(self.coupling_modes)
-        self.coupled_weights = [None]*len(self.coupling_modes)
+        Takes the plain parameter vector, since the ``intermediate_result`` form
+        of the callback requires SciPy 1.11. Raises StopIteration once converged.
+        """
+        self._set_parameters(parameters)
+        loss = self._loss_at(parameters)
+        self._update_convergence(loss)
 
-        for i, mode in enumerate(self.coupling_modes):
-            num_rows = self.coupled_matrices[i].shape[1]
-            num_columns = self.rank
+        if self.print_frequency > 0 and self.current_iteration % self.print_frequency == 0:
+            print(f'    {self.current_iteration}: The MSE is {self.MSE:4g}, f is {self.loss:4g}, improvement is {self._rel_function_change:4g}')
 
-            if self.non_negativity_constraints is None:
-                self.uncoupled_factor_matrices[i] = np.random.randn(num_rows, num_columns)
-            elif self.non_negativity_constraints[mode]:
-                self.uncoupled_factor_matrices[i] = np.random.uniform(0, 1, (num_rows, num_columns))
-            else:
-                self.uncoupled_factor_matrices[i] = np.random.randn(num_rows, num_columns)
+        self._after_fit_iteration()
 
-            self.uncoupled_factor_matrices[i][...] = self.uncoupled_factor_matrices[i]/np.linalg.norm(self.uncoupled_factor_matrices[i], axis=0)
-            self.coupled_weights[i] = np.ones((self.rank,))
+        rel_loss = loss/self.X_norm**2
+        if abs(self._rel_function_change) < self.convergence_tol or rel_loss < self.rel_loss_tol:
+            raise StopIteration
 
+    def _update_convergence(self, loss):
+        self._rel_function_change = (self.prev_SSE - loss)/self.prev_SSE
+        self.prev_SSE = loss
 
-    def init_components(self, initial_decomposition=None):
-        
-        super().init_components(initial_decomposition=initial_decomposition)
-        self._init_coupled_matrices()
\ No newline at end of file
+    def _fit(self):
+        """Fit a CMTF model with L-BFGS or nonlinear conjugate gradients.
+        """
+        max_its = self.max_its - self.current_iteration
+        if max_its > 0:
+            self._absorb_weights()
+            self._last_evaluation = (None, None)
+            try:
+                result = scipy.optimize.minimize(
+                    self._loss_and_gradient,
+                    self._flatten_parameters(),
+                    method=self.method,
+                    jac=True,
+                    callback=self._optimisation_callback,
+                    options={'maxiter': max_its, 'gtol': self.gradient_tol},
+                )
+                self._set_parameters(result.x)
+            except StopIteration:
+                # SciPy < 1.11 does not stop on StopIteration, the callback has already set the parameters
+                pass
+            self._normalize_components()
+
+        if (self.current_iteration % self.checkpoint_frequency != 0) and (self.checkpoint_frequency > 0):
+            self.store_checkpoint()
@@ -104,12 +104,47 @@ class BaseCP(BaseDecomposer):
                 "SVD initialisation does not work when rank is larger than the smallest dimension of X."
                 f" (rank:{self.rank}, dimensions: {self.X.shape})"
             )
+        if isinstance(self.X, decompositions.KruskalTensor):
+            factor_matrices = self._kruskal_tensor_singular_vectors()
+            self.decomposition = self.DecompositionType(factor_matrices)
+            return
+
         for i in range(n_modes):
             u, _, _ = np.linalg.svd(base.unfold(self.X, i))
 
             factor_matrices.append(u[:, :self.rank])
         
         self.decomposition = self.DecompositionType(factor_matrices)
+
+    def _kruskal_tensor_singular_vectors(self):
+        r"""Compute the leading left singular vectors of each unfolding of a Kruskal tensor target.
+
+        With :math:`B_n = Q_n R_n`, the Gram matrix of the n-th unfolding is 
+        :math:`Q_n R_n D G_n D R_n^T Q_n^T`, where :math:`D` is the diagonal weight 
+        matrix and :math:`G_n` is the Hadamard product of the Gram matrices of the
+        other modes. The singular vectors are therefore found from the eigenvectors
+        of a small matrix.
+        """
+        X = self.X
+        if self.rank > X.rank:
+            raise ValueError(
+                "SVD initialisation does not work when the rank is larger than the rank of the target Kruskal tensor."
+                f" (rank:{self.rank}, target rank: {X.rank})"
+            )
+
+        grams = [factor_matrix.T@factor_matrix for factor_matrix in X.factor_matrices]
+        singular_vectors = []
+        for mode, factor_matrix in enumerate(X.factor_matrices):
+            gram_product = np.ones((X.rank, X.rank))
+            for other_mode, gram in enumerate(grams):
+                if other_mode != mode:
+                    gram_product *= gram
+
+            Q, R = np.linalg.qr(factor_matrix)
+            RD = R*X.weights
+            _, eigenvectors = np.linalg.eigh(RD@gram_product@RD.T)
+            singular_vectors.append(Q@eigenvectors[:, ::-1][:, :self.rank])
+        return singular_vectors
  
     def _check_valid_components(self, decomposition):
         """Check if provided factor matrices have correct shape.
@@ -165,19 +200,40 @@ class BaseCP(BaseDecomposer):
     def _fit(self):
         pass
 
+    def set_target(self, X, X_norm=None):
+        """Set target for fitting of model.
+
+        Arguments
+        ---------
+        X : np.ndarray or KruskalTensor
+            The tensor to fit the model to. If X is a Kruskal tensor, then it is 
+            never constructed. 
+        X_norm : float (optional)
+            The Frobenius norm of X. If None, then it is computed from X.
+        """
+        if X_norm is None and isinstance(X, decompositions.KruskalTensor):
+            X_norm = X.norm()
+        super().set_target(X, X_norm=X_norm)
+
     @property
     def SSE(self):
         """Sum Squared Error"""
         if hasattr(self, '_last_updated_mode') and self._last_updated_mode is not None:
             # ||X - Y||_F^2 = ||X||_F^2 + ||Y||_F^2 - 2<X, Y>_F
             # Y = [U_0, U_1, U_2], <X, Y> = sum(U_i*mttkrp(X, Y, skip=i))
+            if isinstance(self.X, decompositions.KruskalTensor):
+                reconstructed_X_norm = self.decomposition.norm()
+            else:
+                reconstructed_X_norm = np.linalg.norm(self.reconstructed_X)
             
             return (
                 self.X_norm**2
-                 + np.linalg.norm(self.reconstructed_X)**2
+                 + reconstructed_X_norm**2
                  - 2*self._inner_prod_X_reconstructed_X
             )
-            
+
+        if isinstance(self.X, decompositions.KruskalTensor):
+            return self.decomposition.distance(self.X)**2
         return np.linalg.norm(self.X - self.reconstructed_X)**2
 
     @property
@@ -190,8 +246,9 @@ class BaseCP(BaseDecomposer):
 
         Arguments:
         ----------
-        X : np.ndarray
-            The tensor to fit
+        X : np.ndarray or KruskalTensor
+            The tensor to fit. A Kruskal tensor target is never constructed, so
+            the cost of fitting depends on its rank and not on the number of elements.
         y : None
             Ignored, included to follow sklearn standards.
         max_its : int (optional)
@@ -212,8 +269,9 @@ class BaseCP(BaseDecomposer):
 
         Arguments:
         ----------
-        X : np.ndarray
-            The tensor to fit
+        X : np.ndarray or KruskalTensor
+            The tensor to fit. A Kruskal tensor target is never constructed, so
+            the cost of fitting depends on its rank and not on the number of elements.
         y : None
             Ignored, included to follow sklearn standards.
         max_its : int (optional)
@@ -361,6 +419,8 @@ class CP_ALS(BaseCP):
         return V
     
     def _get_als_rhs(self, mode):
+        if isinstance(self.X, decompositions.KruskalTensor):
+            return self.X.matrix_khatri_rao_product(self.factor_matrices, mode)
         return base.matrix_khatri_rao_product(self.X, self.factor_matrices, mode)
 
     def _get_rightsolve(self, mode):
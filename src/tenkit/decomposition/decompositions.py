@@ -1,14 +1,70 @@
+from collections import OrderedDict
+import itertools
 import numpy as np
 import h5py
 from abc import ABC, abstractmethod, abstractclassmethod
 from .. import base
 from .. import metrics
 from .. import utils
+from ..ragged import RaggedArray
 
 
 __all__ = ['KruskalTensor', 'EvolvingTensor', 'Parafac2Tensor']
 
 
+# Default scratch memory (in bytes) used when a tensor is constructed into a given output array
+_DEFAULT_MEMORY_BUDGET = 2**27
+# The scratch memory needed to construct a block is about this many times the size of the block
+_SCRATCH_COPIES = 3
+
+
+def _block_shape(shape, max_elements, first_mode=0):
+    """Shape of the largest blocks with at most ``max_elements`` elements, split along ``first_mode`` first.
+
+    If a single slab along ``first_mode`` is too large, then the remaining modes are split in order.
+    """
+    block_shape = list(shape)
+    modes = [first_mode] + [mode for mode in range(len(shape)) if mode != first_mode]
+    for mode in modes:
+        num_other_elements = int(np.prod(block_shape))//block_shape[mode]
+        block_shape[mode] = int(max(1, min(shape[mode], max_elements//num_other_elements)))
+        if np.prod(block_shape) <= max_elements:
+            break
+    return block_shape
+
+
+def _iter_blocks(shape, block_shape):
+    """Iterate over the index tuples (of slices) of the blocks that tile a tensor.
+    """
+    starts = [range(0, length, block_length) for length, block_length in zip(shape, block_shape)]
+    for block_starts in itertools.product(*starts):
+        yield tuple(
+            slice(start, min(start + block_length, length)) 
+                for start, block_length, length in zip(block_starts, block_shape, shape)
+        )
+
+
+def _check_out_shape(out, shape):
+    if tuple(out.shape) != tuple(shape):
+        raise ValueError(f'The output array must have shape {tuple(shape)}, not {tuple(out.shape)}.')
+
+
+def _expand_index(index, ndim):
+    """Pad a basic index (integers and slices) with full slices so that it has one element per mode.
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    if len(index) > ndim:
+        raise IndexError(f'Too many indices for a tensor with {ndim} modes.')
+    for mode_index in index:
+        if not isinstance(mode_index, (int, np.integer, slice)):
+            raise TypeError(
+                f'Only integers and slices are supported, not {type(mode_index).__name__}. '
+                'Use `construct_entries` to look up arrays of coordinates.'
+            )
+    return index + (slice(None),)*(ndim - len(index))
+
+
 class BaseDecomposedTensor(ABC):
     @abstractmethod
     def __init__(self):
@@ -131,12 +187,55 @@ class KruskalTensor(BaseDecomposedTensor):
     def shape(self):
         return [fm.shape[0] for fm in self.factor_matrices]
     
-    def construct_tensor(self):
+    def construct_tensor(self, out=None, chunk_mode=0, memory_budget=None):
+        """Construct the data tensor from the factors.
 
+        If ``out`` or ``memory_budget`` is given, then the tensor is constructed in blocks,
+        split along ``chunk_mode`` first, and written into ``out``.
+
+        Arguments:
+        ----------
+        out: np.ndarray, np.memmap or h5py.Dataset (optional)
+            Array with the same shape as the tensor to store the tensor in.
+            If None, a new array is created.
+        chunk_mode: int (optional, default=0)
+            The mode to split the tensor along when it is constructed in blocks.
+        memory_budget: int (optional)
+            Approximate amount of scratch memory (in bytes) used to construct each block.
+            If None and ``out`` is given, then 128 MiB is used.
+        """
         shape = [f.shape[0] for f in self.factor_matrices]
-        tensor = (self.weights[np.newaxis] * self.factor_matrices[0]) @ base.khatri_rao(*self.factor_matrices[1:]).T
+        if out is None and memory_budget is None:
+            tensor = (self.weights[np.newaxis] * self.factor_matrices[0]) @ base.khatri_rao(*self.factor_matrices[1:]).T
+            return base.fold(tensor, 0, shape=shape)
+
+        if out is None:
+            out = np.empty(shape)
+        _check_out_shape(out, shape)
+        if memory_budget is None:
+            memory_budget = _DEFAULT_MEMORY_BUDGET
+
+        max_elements = max(1, memory_budget//(_SCRATCH_COPIES*np.dtype(float).itemsize))
+        for block in _iter_blocks(shape, _block_shape(shape, max_elements, chunk_mode)):
+            out[block] = self._construct_block(block)
+        return out
+
+    def _construct_block(self, block):
+        """Construct the block of the tensor given by a tuple of slices.
+
+        The longest mode of the block is multiplied with the Khatri-Rao product of 
+        the other modes, so the Khatri-Rao product is smaller than the block (if the
+        rank is lower than the longest block dimension).
+        """
+        factor_matrices = [factor_matrix[index] for factor_matrix, index in zip(self.factor_matrices, block)]
+        longest_mode = int(np.argmax([len(factor_matrix) for factor_matrix in factor_matrices]))
+        other_factor_matrices = factor_matrices[:longest_mode] + factor_matrices[longest_mode+1:]
 
-        return base.fold(tensor, 0, shape=shape)
+        block_tensor = (self.weights*factor_matrices[longest_mode])@base.khatri_rao(*other_factor_matrices).T
+        block_tensor = block_tensor.reshape([len(factor_matrix) for factor_matrix in [
+            factor_matrices[longest_mode], *other_factor_matrices
+        ]])
+        return np.moveaxis(block_tensor, 0, longest_mode)
 
     def reset_weights(self):
         self.weights *= 0
@@ -205,6 +304,160 @@ class KruskalTensor(BaseDecomposedTensor):
 
         return cls(factor_matrices, weights)
     
+    def construct_entries(self, indices):
+        """Construct the elements at the given coordinates without constructing the tensor.
+
+        Arguments:
+        ----------
+        indices: np.ndarray(dtype=int)
+            Array of shape (n, N), where each row is the coordinates of one element.
+
+        Returns:
+        --------
+        np.ndarray:
+            The n elements, equivalent to ``self.construct_tensor()[tuple(indices.T)]``.
+        """
+        indices = np.asarray(indices)
+        entries = np.ones((len(indices), self.rank))*self.weights
+        for mode, factor_matrix in enumerate(self.factor_matrices):
+            entries *= factor_matrix[indices[:, mode]]
+        return entries.sum(axis=1)
+
+    def construct_subtensor(self, index):
+        """Construct a part of the tensor (e.g. an element, fiber or slice) from only the required factor rows.
+
+        Arguments:
+        ----------
+        index: tuple(int or slice)
+            Basic index, equivalent to ``self.construct_tensor()[index]``.
+        """
+        index = _expand_index(index, len(self.factor_matrices))
+        weights = self.weights
+        factor_matrices = []
+        for factor_matrix, mode_index in zip(self.factor_matrices, index):
+            if isinstance(mode_index, slice):
+                factor_matrices.append(factor_matrix[mode_index])
+            else:
+                weights = weights*factor_matrix[mode_index]
+
+        if len(factor_matrices) == 0:
+            return np.sum(weights)
+        elif len(factor_matrices) == 1:
+            return factor_matrices[0]@weights
+        return KruskalTensor(factor_matrices, weights).construct_tensor()
+
+    def _check_same_shape(self, other):
+        if list(self.shape) != list(other.shape):
+            raise ValueError(
+                f'The Kruskal tensors must have the same shape, not {self.shape} and {other.shape}.'
+            )
+
+    def inner_product(self, other):
+        r"""Compute the inner product with another Kruskal tensor without constructing the tensors.
+
+        The inner product is given by
+
+        .. math::
+
+            \langle \mathcal{X}, \mathcal{Y} \rangle = 
+                \mathbf{w}^T (A_1^T B_1 * ... * A_N^T B_N) \mathbf{v},
+
+        where :math:`A_n, \mathbf{w}` and :math:`B_n, \mathbf{v}` are the factor matrices 
+        and weights of :math:`\mathcal{X}` and :math:`\mathcal{Y}`, respectively.
+        """
+        self._check_same_shape(other)
+        cross_gram_product = np.ones((self.rank, other.rank))
+        for factor_matrix, other_factor_matrix in zip(self.factor_matrices, other.factor_matrices):
+            cross_gram_product *= factor_matrix.T@other_factor_matrix
+        return self.weights@cross_gram_product@other.weights
+
+    def matrix_khatri_rao_product(self, factor_matrices, mode):
+        r"""Compute the MTTKRP of this tensor with the given factor matrices without constructing the tensor.
+
+        With :math:`B_n` and :math:`\mathbf{v}` as the factor matrices and weights of this
+        tensor, the MTTKRP along mode :math:`n` is given by
+
+        .. math::
+
+            B_n \text{diag}(\mathbf{v}) (B_1^T A_1 * ... * B_{n-1}^T A_{n-1} * B_{n+1}^T A_{n+1} * ... * B_N^T A_N).
+
+        Arguments:
+        ----------
+        factor_matrices: list(np.ndarray)
+            List of factor matrices, the i-th factor matrix has shape [self.shape[i], rank].
+        mode: int
+            Which mode to compute the MTTKRP along.
+        """
+        cross_gram_product = np.ones((self.rank, factor_matrices[0].shape[1]))
+        for i, (factor_matrix, other_factor_matrix) in enumerate(zip(self.factor_matrices, factor_matrices)):
+            if i != mode:
+                cross_gram_product *= factor_matrix.T@other_factor_matrix
+        return (self.factor_matrices[mode]*self.weights)@cross_gram_product
+
+    def norm(self):
+        """Compute the Frobenius norm without constructing the tensor.
+        """
+        return np.sqrt(max(self.inner_product(self), 0))
+
+    def distance(self, other):
+        r"""Compute the Frobenius norm of the difference to another Kruskal tensor without constructing the tensors.
+
+        The norm of the difference is computed from a Kruskal tensor that represents
+        the difference (see ``_difference``), instead of expanding 
+        :math:`\|\mathcal{X}\|^2 + \|\mathcal{Y}\|^2 - 2 \langle \mathcal{X}, \mathcal{Y} \rangle`,
+        which cancels catastrophically for nearly equal tensors.
+        """
+        return self._difference(other).norm()
+
+    def _difference(self, other):
+        r"""Kruskal tensor that represents the difference to another Kruskal tensor.
+
+        If the tensors have the same rank, then the difference is telescoped component-wise,
+
+        .. math::
+
+            [[\mathbf{w}; A_1, ..., A_N]] - [[\mathbf{v}; B_1, ..., B_N]] = 
+                [[\mathbf{w} - \mathbf{v}; A_1, ..., A_N]] 
+                + \sum_n [[\mathbf{v}; B_1, ..., B_{n-1}, A_n - B_n, A_{n+1}, ..., A_N]],
+
+        so the factor matrices of the difference are small if the components are close
+        and its norm is accurate relative to the distance. Otherwise, the components of 
+        ``other`` are appended with negated weights.
+        """
+        self._check_same_shape(other)
+        if self.rank != other.rank:
+            return self + KruskalTensor(other.factor_matrices, -other.weights)
+
+        factor_matrices = [[factor_matrix] for factor_matrix in self.factor_matrices]
+        weights = [self.weights - other.weights]
+        for n in range(len(self.factor_matrices)):
+            for m, (factor_matrix, other_factor_matrix) in enumerate(zip(self.factor_matrices, other.factor_matrices)):
+                if m < n:
+                    factor_matrices[m].append(other_factor_matrix)
+                elif m == n:
+                    factor_matrices[m].append(factor_matrix - other_factor_matrix)
+                else:
+                    factor_matrices[m].append(factor_matrix)
+            weights.append(other.weights)
+
+        return KruskalTensor(
+            [np.concatenate(blocks, axis=1) for blocks in factor_matrices], np.concatenate(weights)
+        )
+
+    def __add__(self, other):
+        """The sum of two Kruskal tensors is the Kruskal tensor with the components of both.
+        """
+        if not isinstance(other, KruskalTensor):
+            return NotImplemented
+        self._check_same_shape(other)
+
+        factor_matrices = [
+            np.concatenate([factor_matrix, other_factor_matrix], axis=1)
+            for factor_matrix, other_factor_matrix in zip(self.factor_matrices, other.factor_matrices)
+        ]
+        weights = np.concatenate([self.weights, other.weights])
+        return KruskalTensor(factor_matrices, weights)
+
     def __getitem__(self, item):
         return self.factor_matrices[item]
 
@@ -217,9 +470,9 @@ class KruskalTensor(BaseDecomposedTensor):
                                           fms_reduction=fms_reduction)
     
     def seperate_mode_factor_match_score(self, decomposition, fms_reduction='min'):
-        return metrics.seperate_mode_factor_match_score(self.factor_matrices,
-                                                        decomposition.factor_matrices, 
-                                                        fms_reduction=fms_reduction)
+        return metrics.separate_mode_factor_match_score(self.factor_matrices,
+                                                         decomposition.factor_matrices, 
+                                                         fms_reduction=fms_reduction)
     def get_sign_scores(self, X):
         sign_scores = []
         for n, factor_matrix in enumerate(self.factor_matrices):
@@ -270,10 +523,14 @@ class KruskalTensor(BaseDecomposedTensor):
 
         return degeneracy_scores
     
+    def leverages(self):
+        """Compute the leverage scores of the rows of each factor matrix.
+        """
+        return [metrics.leverage(factor_matrix) for factor_matrix in self.factor_matrices]
+
     def core_consistency(self, X, normalized=False):
-        if len(self.factor_matrices) != 3:
-            raise ValueError('Core consistency is only implemented for third order tensors')
-        return metrics.core_consistency(X, *self.factor_matrices, normalized=normalized)
+        factor_matrices = [self.factor_matrices[0]*self.weights, *self.factor_matrices[1:]]
+        return metrics.core_consistency(X, *factor_matrices, normalized=normalized)
         
 
 class EvolvingTensor(BaseDecomposedTensor):
@@ -384,12 +641,34 @@ class EvolvingTensor(BaseDecomposedTensor):
     
     def construct_slices(self):
         """Construct the list of frontal slices of the evolving tensor.
+
+        Slices with the same size are constructed together with one batched matrix product.
         """
-        slices = [None]*len(self.B)
-        for k, matrix_size in enumerate(self.slice_shapes):
-            slices[k] = self.construct_slice(k)
+        slices = [None]*len(self.slice_shapes)
+        for slice_indices in self._slice_buckets(0, len(self.slice_shapes)):
+            for k, slice_ in zip(slice_indices, self._construct_slice_batch(slice_indices)):
+                slices[k] = slice_
         
         return slices
+
+    def _slice_buckets(self, start, stop):
+        """Group the frontal slices from ``start`` to ``stop`` into arrays of indices of equally sized slices.
+        """
+        widths = np.array([shape[1] for shape in self.slice_shapes[start:stop]])
+        return [start + np.flatnonzero(widths == width) for width in np.unique(widths)]
+
+    def _stacked_evolving_factors(self, slice_indices):
+        """The evolving factor matrices of equally sized slices as a three-way array.
+        """
+        if isinstance(self.B, np.ndarray):
+            return self.B[slice_indices]
+        return np.stack([self.B[k] for k in slice_indices])
+
+    def _construct_slice_batch(self, slice_indices):
+        """Construct equally sized frontal slices as an array of shape (len(slice_indices), I, J_k).
+        """
+        scores = self._stacked_evolving_factors(slice_indices)*self.C[slice_indices, np.newaxis]
+        return np.matmul(self.A, np.swapaxes(scores, 1, 2))
             
     def construct_slice(self, k):
         """Construct the k-th slice along the third mode of the tensor.
@@ -399,9 +678,109 @@ class EvolvingTensor(BaseDecomposedTensor):
 
         return loadings @ scores.T
 
-    def construct_tensor(self):
+    def _normalize_slice_row_indices(self, slice_indices, row_indices):
+        """Wrap negative slice and row indices and check that each row is inside its slice.
+        """
+        num_slices = len(self.slice_shapes)
+        slice_indices = np.where(slice_indices < 0, slice_indices + num_slices, slice_indices)
+        if np.any((slice_indices < 0) | (slice_indices >= num_slices)):
+            raise IndexError('Index along the third mode is out of bounds.')
+
+        lengths = np.array([shape[1] for shape in self.slice_shapes])[slice_indices]
+        row_indices = np.where(row_indices < 0, row_indices + lengths, row_indices)
+        if np.any((row_indices < 0) | (row_indices >= lengths)):
+            raise IndexError('Index along the second mode is out of bounds for the corresponding frontal slice.')
+        return slice_indices, row_indices
+
+    def _evolving_factor_rows(self, slice_indices, row_indices):
+        """Get the rows of the evolving factor matrices, the ``row_indices[n]``-th row of ``B[slice_indices[n]]``.
+
+        The indices are grouped by slice with one sort, so each :math:`B_k` is accessed once.
+        """
+        slice_indices, row_indices = self._normalize_slice_row_indices(slice_indices, row_indices)
+        order = np.argsort(slice_indices, kind='stable')
+        unique_slices, group_starts = np.unique(slice_indices[order], return_index=True)
+        group_stops = np.append(group_starts[1:], len(order))
+
+        rows = np.empty((len(slice_indices), self.rank))
+        for k, start, stop in zip(unique_slices, group_starts, group_stops):
+            group = order[start:stop]
+            rows[group] = self.B[k][row_indices[group]]
+        return rows
+
+    def construct_entries(self, indices):
+        """Construct the elements at the given coordinates without constructing the tensor.
+
+        The indices refer to the zero padded tensor, like ``construct_subtensor``. 
+        Negative indices wrap around ``self.shape`` and elements in the zero 
+        padding of the irregular slices are zero.
+
+        Arguments:
+        ----------
+        indices: np.ndarray(dtype=int)
+            Array of shape (n, 3), where each row is the (i, j, k) coordinates of one element.
+            An IndexError is raised if an index is outside ``self.shape``.
+
+        Returns:
+        --------
+        np.ndarray:
+            The n elements, equivalent to ``self.construct_tensor()[tuple(indices.T)]``.
+        """
+        indices = np.asarray(indices)
+        i, j, k = (np.arange(size)[indices[:, mode]] for mode, size in enumerate(self.shape))
+
+        lengths = np.array([shape[1] for shape in self.slice_shapes])
+        is_in_slice = j < lengths[k]
+        i, j, k = i[is_in_slice], j[is_in_slice], k[is_in_slice]
+
+        entries = np.zeros(len(indices))
+        entries[is_in_slice] = np.sum(self.A[i]*self._evolving_factor_rows(k, j)*self.C[k], axis=1)
+        return entries
+
+    def construct_subtensor(self, index):
+        """Construct a part of the tensor (e.g. an element, fiber or slice) from only the required factor rows.
+
+        Zero padding is used for the irregular slices.
+
+        Arguments:
+        ----------
+        index: tuple(int or slice)
+            Basic index, equivalent to ``self.construct_tensor()[index]``.
+        """
+        i_index, j_index, k_index = _expand_index(index, 3)
+        A = self.A[i_index]
+        rows = np.asarray(np.arange(self.shape[1])[j_index])
+
+        subtensor = []
+        for k in np.atleast_1d(np.arange(len(self.slice_shapes))[k_index]):
+            B_k = self.B[k]
+            B_k_rows = np.zeros(rows.shape + (self.rank,))
+            is_in_slice = rows < B_k.shape[0]
+            B_k_rows[is_in_slice] = B_k[rows[is_in_slice]]
+            subtensor.append((A*self.C[k])@B_k_rows.T)
+
+        if isinstance(k_index, slice):
+            return np.stack(subtensor, axis=-1)
+        return subtensor[0]
+
+    def construct_tensor(self, out=None, memory_budget=None):
         """Construct the datatensor from the factors. 
         Zero padding will be used if the tensor is irregular.
+
+        If ``out`` or ``memory_budget`` is given, then the tensor is constructed in 
+        chunks of frontal slices that are written into ``out``. If a single frontal
+        slice exceeds the memory budget, then each slice is constructed in blocks 
+        of rows (along the first mode) instead.
+
+        Arguments:
+        ----------
+        out: np.ndarray, np.memmap or h5py.Dataset (optional)
+            Array with the same shape as the tensor to store the tensor in.
+            If None, a new array is created.
+        memory_budget: int (optional)
+            Approximate amount of scratch memory (in bytes) used to construct each chunk.
+            If None and ``out`` is given, then 128 MiB is used. At least one row of 
+            a frontal slice is constructed at the time.
         """
         if self.warning and not self.all_same_size:
             raise Warning(
@@ -411,10 +790,57 @@ class EvolvingTensor(BaseDecomposedTensor):
             )
 
         shape = self.shape
-        constructed = np.zeros(shape)
-        for k, _ in enumerate(self.slice_shapes):
-            slice_ = self.construct_slice(k)
-            constructed[:, :slice_.shape[1], k] = slice_
+        if out is None and memory_budget is None:
+            return self._construct_slices_padded(0, shape[2])
+
+        if out is None:
+            out = np.empty(shape)
+        _check_out_shape(out, shape)
+        if memory_budget is None:
+            memory_budget = _DEFAULT_MEMORY_BUDGET
+
+        row_size = _SCRATCH_COPIES*np.dtype(float).itemsize*shape[1]
+        slab_size = row_size*shape[0]
+        if slab_size > memory_budget:
+            self._construct_slices_in_row_blocks(out, max(1, memory_budget//row_size))
+            return out
+
+        num_slices_per_chunk = memory_budget//slab_size
+        for start in range(0, shape[2], num_slices_per_chunk):
+            stop = min(start + num_slices_per_chunk, shape[2])
+            out[:, :, start:stop] = self._construct_slices_padded(start, stop)
+        return out
+
+    def _construct_slices_in_row_blocks(self, out, num_rows_per_chunk):
+        """Construct one frontal slice at the time into ``out``, ``num_rows_per_chunk`` rows at the time.
+        """
+        I, J, K = self.shape
+        for k in range(K):
+            scores = self.C[k]*self.B[k]
+            for start in range(0, I, num_rows_per_chunk):
+                stop = min(start + num_rows_per_chunk, I)
+                rows = np.zeros((stop - start, J))
+                rows[:, :scores.shape[0]] = self.A[start:stop]@scores.T
+                out[start:stop, :, k] = rows
+
+    def _construct_slices_padded(self, start, stop):
+        """Construct the frontal slices from ``start`` to ``stop`` as a zero padded three-way array.
+
+        If all slices are equally sized, then they are constructed with one matrix product.
+        Otherwise, equally sized slices are constructed together.
+        """
+        I, J, _ = self.shape
+        K = stop - start
+        if self.all_same_size:
+            # X_ijk = sum_r A_ir B_kjr C_kr, computed as one matrix product with the (jk)-rows of B_k diag(c_k)
+            B = self._stacked_evolving_factors(np.arange(start, stop))
+            scores = np.swapaxes(B, 0, 1)*self.C[np.newaxis, start:stop]
+            return (self.A@scores.reshape(J*K, self.rank).T).reshape(I, J, K)
+
+        constructed = np.zeros((I, J, K))
+        for slice_indices in self._slice_buckets(start, stop):
+            slices = self._construct_slice_batch(slice_indices)
+            constructed[:, :slices.shape[2], slice_indices - start] = np.moveaxis(slices, 0, -1)
         return constructed
 
     def store_in_hdf5_group(self, group):
@@ -489,24 +915,94 @@ class ProjectedFactor:
     
     for a set of orthogonal matrices :math:`{P_k}_k=1^K` and a blueprint
     factor matric :math:`B \in \mathbb{R}^{r \times r}`.
+
+    The evolving factor matrices are cached once they are computed. With an
+    unbounded cache (``cache_size=None``), all :math:`B_k` are computed at
+    once with a single matrix product the first time any of them are 
+    needed. With a bounded cache, at most ``cache_size`` of the :math:`B_k`
+    matrices are kept, and the least recently used matrix is evicted first.
+    The cached matrices are read-only.
+
+    The cache is cleared if ``blueprint_factor_matrix`` or ``projection_matrices``
+    is set (also when they are set through ``Parafac2Tensor``). If these are 
+    modified in place, then ``clear_cache`` must be called.
     
     Arguments:
     ----------
     blueprint_factor_matrix: np.ndarray
         Blueprint factor matrix used to generate the evolving factor matrices.
-    projection_matrices: list(np.ndarray)
+    projection_matrices: list(np.ndarray) or tenkit.ragged.RaggedArray
         Projection matrices used to generate the evolving factor matrices
+    cache_size: int (optional, default=None)
+        Maximum number of evolving factor matrices to cache. If None, then all
+        are cached and if 0, then caching is disabled.
     """
-    def __init__(self, blueprint_factor_matrix, projection_matrices):
-        self.blueprint_factor_matrix = blueprint_factor_matrix
-        self.projection_matrices = projection_matrices
+    def __init__(self, blueprint_factor_matrix, projection_matrices, cache_size=None):
+        self.cache_size = cache_size
+        self._blueprint_factor_matrix = blueprint_factor_matrix
+        self._projection_matrices = projection_matrices
+        self.clear_cache()
+
+    @property
+    def blueprint_factor_matrix(self):
+        return self._blueprint_factor_matrix
+
+    @blueprint_factor_matrix.setter
+    def blueprint_factor_matrix(self, value):
+        self._blueprint_factor_matrix = value
+        self.clear_cache()
+
+    @property
+    def projection_matrices(self):
+        return self._projection_matrices
+
+    @projection_matrices.setter
+    def projection_matrices(self, value):
+        self._projection_matrices = value
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Remove all cached evolving factor matrices. 
+        
+        Must be called if the blueprint or projection matrices are modified in place.
+        """
+        self._materialized = None
+        self._lru_cache = OrderedDict()
+
+    def _materialize(self):
+        """Compute and cache all evolving factor matrices as one ragged array.
+        """
+        if self._materialized is None:
+            projection_matrices = RaggedArray.from_list(self.projection_matrices)
+            unfolded = projection_matrices.data@self.blueprint_factor_matrix
+            unfolded.flags.writeable = False
+            self._materialized = RaggedArray(unfolded, projection_matrices.offsets)
+        return self._materialized
+
+    def _get_evolving_factor(self, k):
+        if self.cache_size is None:
+            return self._materialize()[k]
+
+        if k < 0:
+            k += len(self)
+        if k in self._lru_cache:
+            self._lru_cache.move_to_end(k)
+            return self._lru_cache[k]
+
+        B_k = self.projection_matrices[k]@self.blueprint_factor_matrix
+        if self.cache_size > 0:
+            B_k.flags.writeable = False
+            self._lru_cache[k] = B_k
+            while len(self._lru_cache) > self.cache_size:
+                self._lru_cache.popitem(last=False)
+        return B_k
     
     def __getitem__(self, k):
         slice_ = slice(None, None, None)
         if isinstance(k, tuple):
             slice_ = tuple(ki for ki in k[1:])
             k = k[0]
-        return (self.projection_matrices[k]@self.blueprint_factor_matrix)[slice_]
+        return self._get_evolving_factor(k)[slice_]
     
     def __len__(self):
         return len(self.projection_matrices)
@@ -514,6 +1010,31 @@ class ProjectedFactor:
     def as_list(self):
         return list(self)
 
+    def unfolded(self, start=None, stop=None):
+        """The evolving factor matrices stacked on top of each other.
+
+        If ``start`` and ``stop`` are given, then only :math:`B_k` for 
+        ``k = start, ..., stop-1`` are stacked. With a bounded cache, only 
+        these are computed, so a loop over chunks of slices does not repeat
+        the work for all :math:`K` slices.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if self.cache_size is None:
+            materialized = self._materialize()
+            return materialized.data[materialized.offsets[start]:materialized.offsets[stop]]
+        if isinstance(self.projection_matrices, RaggedArray):
+            return self.projection_matrices.chunk(start, stop).data@self.blueprint_factor_matrix
+        return np.concatenate([self[k] for k in range(start, stop)], axis=0)
+
+    def stacked(self):
+        """The evolving factor matrices as a three-way array (only if they are equally sized).
+        """
+        if self.cache_size is None:
+            return self._materialize().stacked()
+        if isinstance(self.projection_matrices, RaggedArray):
+            return self.projection_matrices.stacked()@self.blueprint_factor_matrix
+        return np.asarray(self.projection_matrices)@self.blueprint_factor_matrix
+
 
 class Parafac2Tensor(EvolvingTensor):
     r"""Container class for PARAFAC2 tensors whose second mode evolve over the third.
@@ -560,15 +1081,26 @@ class Parafac2Tensor(EvolvingTensor):
         The blueprint matrix used to construct the :math:`B_k` matrices.
     C : np.ndarray(ndim=2)
         The factor matrix along the final mode.
-    projection_matrices : list(np.ndarray(ndim=2))
+    projection_matrices : list(np.ndarray(ndim=2)), np.ndarray(ndim=3) or tenkit.ragged.RaggedArray
         A list with the projection matrices used to construct the :math:`B_k` matrices.
+        The projection matrices are copied into a single 
+        :class:`tenkit.ragged.RaggedArray` unless they are stored in one already.
+        If all projection matrices have the same shape, they can also be given 
+        as a :math:`K \times J \times R` array, and the buffer of the ragged array 
+        is then laid out as this three-way array (see ``RaggedArray.stacked``).
     warning : Bool (default=True)
         Whether or not a warning should be raised when 
         ``construct_tensor`` is called if all the matrices are not 
         the same size.
+    cache_size : int (default=None)
+        Maximum number of evolving factor matrices, :math:`B_k`, to cache. 
+        If None, then all are cached, and if 0, then nothing is cached. 
+        See ``ProjectedFactor`` for details. The cache is cleared when 
+        ``blueprint_B`` or ``projection_matrices`` is set, but it must be cleared
+        with ``B.clear_cache()`` if they are modified in place.
     """
     pm_template = 'projection_matrix_{:03d}'
-    def __init__(self, A, blueprint_B, C, projection_matrices, warning=True):
+    def __init__(self, A, blueprint_B, C, projection_matrices, warning=True, cache_size=None):
         r"""A tensor whose second mode evolves over the third mode according to the PARAFAC2 constraints.
 
         Let $X_k$ be the $k$-th slice of the matrix along the third mode. The tensor can then be
@@ -588,21 +1120,52 @@ class Parafac2Tensor(EvolvingTensor):
         ----------
         factor_matrices : list[np.ndarray]
             A list of factor matrices, the second element should be the blueprint matrix.
-        projection_matrices : list[np.ndarray]
+        projection_matrices : list[np.ndarray] or tenkit.ragged.RaggedArray
         """
         self.rank = A.shape[1]
         self._A = A
         self._blueprint_B = blueprint_B
         self._C = C
-        self._projection_matrices = tuple(projection_matrices)
-        self._B = ProjectedFactor(blueprint_B, self._projection_matrices)
+        self._projection_matrices = self._as_ragged_projection_matrices(projection_matrices)
+        self._B = ProjectedFactor(blueprint_B, self._projection_matrices, cache_size=cache_size)
+        self._update_slice_shapes()
+
+        self.warning = warning
 
+    @staticmethod
+    def _as_ragged_projection_matrices(projection_matrices):
+        if isinstance(projection_matrices, np.ndarray) and projection_matrices.ndim == 3:
+            return RaggedArray.from_stacked(projection_matrices, ragged_axis=0)
+        return RaggedArray.from_list(projection_matrices, ragged_axis=0)
 
-        self.all_same_size = self._check_all_same_size(projection_matrices)
-        self.slice_shapes = [(self.A.shape[0], B_k.shape[0]) for B_k in self.B] 
+    def _update_slice_shapes(self):
+        self.all_same_size = self._projection_matrices.all_same_size
+        self.slice_shapes = [(self.A.shape[0], J_k) for J_k in self._projection_matrices.lengths] 
         self.num_elements = sum(shape[1] for shape in self.slice_shapes)
 
-        self.warning = warning
+    def append_slices(self, projection_matrices, C):
+        """Extend the decomposition in place with components for new frontal slices.
+
+        The factor matrix :math:`A` and the blueprint matrix are shared by all slices,
+        so only the projection matrices and the rows of :math:`C` are appended.
+
+        Arguments:
+        ----------
+        projection_matrices : list(np.ndarray(ndim=2)) or tenkit.ragged.RaggedArray
+            The projection matrices of the new slices.
+        C : np.ndarray(ndim=2)
+            The rows of the C factor matrix that correspond to the new slices.
+        """
+        if len(projection_matrices) != len(C):
+            raise ValueError(
+                f'The number of projection matrices ({len(projection_matrices)}) must equal '
+                f'the number of new rows in C ({len(C)})'
+            )
+        new_projection_matrices = RaggedArray.from_list(projection_matrices, ragged_axis=0)
+        self._projection_matrices = self._projection_matrices.concatenate(new_projection_matrices)
+        self._C = np.concatenate([self._C, C], axis=0)
+        self._B.projection_matrices = self._projection_matrices
+        self._update_slice_shapes()
 
 
     @property
@@ -617,10 +1180,25 @@ class Parafac2Tensor(EvolvingTensor):
     def blueprint_B(self):
         return self._blueprint_B
 
+    @blueprint_B.setter
+    def blueprint_B(self, value):
+        self._blueprint_B = value
+        self._B.blueprint_factor_matrix = value
+
     @property
     def projection_matrices(self):
         return self._projection_matrices
+
+    @projection_matrices.setter
+    def projection_matrices(self, value):
+        self._projection_matrices = self._as_ragged_projection_matrices(value)
+        self._B.projection_matrices = self._projection_matrices
+        self._update_slice_shapes()
                 
+    @property
+    def B_unfolded(self):
+        return self.B.unfolded()
+
     @property
     def D(self):
         return np.array([np.diag(self.C[:, r]) for r in range(self.rank)])
@@ -655,19 +1233,48 @@ class Parafac2Tensor(EvolvingTensor):
         
         return cls(A, blueprint_B, C, projection_matrices, all_same_size)
 
+    def _evolving_factor_rows(self, slice_indices, row_indices):
+        """Get the rows of the evolving factor matrices directly from the rows of the projection matrices.
+        """
+        slice_indices, row_indices = self._normalize_slice_row_indices(slice_indices, row_indices)
+        offsets = np.asarray(self.projection_matrices.offsets)[slice_indices]
+        return self.projection_matrices.data[offsets + row_indices]@self.blueprint_B
+
+    def construct_ragged_slices(self):
+        r"""Construct the frontal slices of the tensor as a single :class:`tenkit.ragged.RaggedArray`.
+
+        All slices are computed with one matrix product, 
+        :math:`[X_1 \cdots X_K]^T = [B_1 \text{diag}(\mathbf{c}_1) \cdots B_K \text{diag}(\mathbf{c}_K)]^T A^T`.
+        """
+        projection_matrices = self.projection_matrices
+        scores = self.B.unfolded()*projection_matrices.repeat(self.C)
+        return RaggedArray(scores@self.A.T, projection_matrices.offsets, ragged_axis=1)
+
+    def construct_slices(self):
+        """Construct the list of frontal slices of the evolving tensor.
+
+        The slices are views into one contiguous array.
+        """
+        return list(self.construct_ragged_slices())
+
+    def _stacked_evolving_factors(self, slice_indices):
+        """The evolving factor matrices of equally sized slices as a three-way array.
+        """
+        if self.B.cache_size is None and self.all_same_size:
+            return self.B.stacked()[slice_indices]
+        return super()._stacked_evolving_factors(slice_indices)
+
     def store_in_hdf5_group(self, group):
         self._prepare_hdf5_group(group)
 
         group.attrs['rank'] = self.rank
         group.attrs['all_same_size'] = self.all_same_size
         group.attrs['warning'] = self.warning
-        group.attrs['n_projection_matrices'] = len(self.projection_matrices)
 
         group['A'] = self.A
         group['blueprint_B'] = self.blueprint_B
         group['C'] = self.C
-        for i, pm in enumerate(self.projection_matrices):
-            group[self.pm_template.format(i)] = pm
+        self.projection_matrices.store_in_hdf5_group(group, 'projection_matrices')
         
     @classmethod
     def load_from_hdf5_group(cls, group):
@@ -678,18 +1285,22 @@ class Parafac2Tensor(EvolvingTensor):
         C = group['C'][...]
         warning = group.attrs['warning']
 
-        projection_matrices = [
-            group[cls.pm_template.format(i)][...]
-                for i in range(group.attrs['n_projection_matrices'])
-        ]
+        if 'n_projection_matrices' in group.attrs:
+            # Files stored before the projection matrices were stored in a single dataset
+            projection_matrices = [
+                group[cls.pm_template.format(i)][...]
+                    for i in range(group.attrs['n_projection_matrices'])
+            ]
+        else:
+            projection_matrices = RaggedArray.load_from_hdf5_group(group, 'projection_matrices')
 
         return cls(A, blueprint_B, C, projection_matrices, warning=warning)
 
     def factor_match_score(self, decomposition, weight_penalty=True, fms_reduction='min'):
         assert decomposition.rank == self.rank
 
-        factors1 = [self.A, np.array(self.B).reshape(-1, self.rank), self.C]
-        factors2 = [decomposition.A, np.array(decomposition.B).reshape(-1, self.rank), decomposition.C]
+        factors1 = [self.A, self.B_unfolded, self.C]
+        factors2 = [decomposition.A, decomposition.B_unfolded, decomposition.C]
 
         return metrics.factor_match_score(factors1, 
                                           factors2, 
@@ -1,15 +1,39 @@
 from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import warnings
 import numpy as np
+import h5py
 from .base_decomposer import BaseDecomposer
 from . import decompositions
 from . import cp
-from ..utils import normalize_factors, get_pca_loadings
+from ..utils import normalize_factors, get_symmetric_pca_loadings
+from ..ragged import RaggedArray, LazyRaggedArray
 from .. import base
 
 
-__all__ = ['Parafac2_ALS']
+__all__ = ['Parafac2_ALS', 'Parafac2_SALS']
+
+
+def _as_ragged_slices(X):
+    """Store the frontal slices of X in a (possibly lazy) ragged array with ``ragged_axis=1``.
+    """
+    # The slices are copied into one buffer to enable bulk operations. If all 
+    # slices have the same size, then the buffer can be viewed as a K x I x J
+    # array, which we use for batched matrix products. Slices that are not 
+    # already in memory are instead read chunk by chunk when they are needed.
+    if isinstance(X, np.ndarray):
+        return RaggedArray.from_stacked(X.transpose(2, 0, 1), ragged_axis=1)
+    elif isinstance(X, h5py.Group):
+        return LazyRaggedArray.from_hdf5_group(X, ragged_axis=1)
+    elif isinstance(X, LazyRaggedArray):
+        if X.ragged_axis != 1:
+            raise ValueError('The slices must be stored with `ragged_axis=1`.')
+        return X
+    elif isinstance(X, (list, tuple, RaggedArray)):
+        return RaggedArray.from_list(X, ragged_axis=1)
+    return LazyRaggedArray(X, ragged_axis=1)
 
 
 class BaseParafac2(BaseDecomposer):
@@ -60,8 +84,18 @@ class BaseParafac2(BaseDecomposer):
     print_frequency: int (optional, default=None)
         How often convergence information should be printed in the terminal.
         None and negative values leads to no printing.
+    n_threads: int (optional, default=1)
+        Number of threads used for the work that is done separately for each 
+        slice (updating the projection matrices, computing the projected tensor,
+        :math:`X_k P_k`, and computing the loss). The slices are split into chunks 
+        with roughly the same number of elements that are processed by a thread
+        pool. If 1, then no thread pool is used.
     """
     DecompositionType = decompositions.Parafac2Tensor
+    _chunks_per_thread = 4
+    # Maximum number of elements in a chunk of slices that is read from a lazy source
+    _max_lazy_chunk_size = 2**22
+    _num_prefetched_chunks = 2
     def __init__(self, 
         rank, 
         max_its=1000, 
@@ -71,6 +105,7 @@ class BaseParafac2(BaseDecomposer):
         checkpoint_frequency=None,
         checkpoint_path=None,
         print_frequency=10,
+        n_threads=1,
     ):
         super().__init__(
             max_its=max_its,
@@ -83,16 +118,27 @@ class BaseParafac2(BaseDecomposer):
 
         self.rank = rank
         self.init = init
+        self.n_threads = n_threads
 
     def set_target(self, X):
-        if not isinstance(X, list):
+        if isinstance(X, np.ndarray):
             self.target_tensor = X
-            X = X.transpose(2, 0, 1)
+        X = _as_ragged_slices(X)
         
         self.X = X
-        self.X_shape = [len(X[0]), [Xk.shape[1] for Xk in X], len(X)]    # len(A), len(Bk), len(C)
-        self.X_norm = np.sqrt(sum(np.linalg.norm(Xk)**2 for Xk in X))
+        self.X_shape = [X.width, X.lengths.tolist(), len(X)]    # len(A), len(Bk), len(C)
+        self.X_norm = X.norm()
         self.num_X_elements = sum([np.prod(s) for s in self.X_shape])
+        self._allocate_slice_buffers()
+        self._projected_X_is_current = False
+
+    def _allocate_slice_buffers(self):
+        """Preallocate the buffers that are filled in place, one chunk of slices at the time.
+        """
+        I, K = self.X_shape[0], self.X_shape[2]
+        self._projected_X = np.empty((I, self.rank, K))
+        self._projected_X_slice_sq_norms = np.empty(K)
+        self._slice_SSE = np.empty(K)
 
     def init_random(self):
         """Random initialisation of the factor matrices
@@ -100,29 +146,37 @@ class BaseParafac2(BaseDecomposer):
         self.decomposition = self.DecompositionType.random_init(self.X_shape, rank=self.rank)
 
     def init_svd(self):
-        """SVD initalisation
-        """
-        # TODO: This does not work for irregular tensors
-        K = self.X_shape[2]
-        J = self.X_shape[1]
-        Y = np.zeros([J, J])
-
-        for k in range(K):
-            Y += self.X[k].T @ self.X[k]
+        r"""SVD initalisation
 
-        A = get_pca_loadings(Y, self.rank)
+        :math:`A` is initialised as the PCA loadings of the :math:`I \times I` 
+        cross product matrix, :math:`\sum_k X_k X_k^T`, which is accumulated 
+        chunk by chunk (in parallel if ``n_threads > 1``). Works for slices of 
+        different sizes, and only the leading eigenvectors are computed.
+        """
+        A = get_symmetric_pca_loadings(self._slice_cross_product(), self.rank)
         blueprint_B = np.identity(self.rank)
-        C = np.ones((K, self.rank))
+        C = np.ones((self.X_shape[2], self.rank))
 
-        P = [np.eye(J, self.rank) for k in range(K)]
+        P = [np.eye(J_k, self.rank) for J_k in self.X.lengths]
         self.decomposition = self.DecompositionType(A, blueprint_B, C, P)
 
         self._update_projection_matrices()
+
+    def _slice_cross_product(self):
+        r"""Compute :math:`\sum_k X_k X_k^T`.
+        """
+        partial_sums = {}
+        def accumulate_chunk(start, stop, X):
+            # The chunk buffer is the transpose of the concatenated slices, [X_1 ... X_n]^T
+            partial_sums[start] = X.data.T@X.data
+
+        self._for_each_slice_chunk(accumulate_chunk)
+        return sum(partial_sums.values())
     
     def init_cp(self):
         """CP initialisation. Input must be a tensor.
         """
-        X = np.asarray(self.X)
+        X = self.X.stacked()
         cp_als = cp.CP_ALS(self.rank, 20)
         cp_als.fit(X)
         C, A, B = cp_als.factor_matrices
@@ -147,6 +201,7 @@ class BaseParafac2(BaseDecomposer):
         else:
             # TODO: better message
             raise ValueError('Init method must be either `random`, `svd`, `from_checkpoint` or `precomputed`.')
+        self._projected_X_is_current = False
 
     def _check_valid_components(self, decomposition):
         for i, factor_matrix, factor_name in zip([0, 2], [decomposition.A, decomposition.C], ['A', 'C']):
@@ -160,11 +215,11 @@ class BaseParafac2(BaseDecomposer):
                     f"The number of columns of {factor_name} ({factor_matrix.shape[1]}) does not agree with the models rank ({self.rank})"
                 )
         
-        for k, (B, X_slice) in enumerate(zip(decomposition.B, self.X)):
-            if B.shape[0] != X_slice.shape[1]:
+        for k, (B, slice_shape) in enumerate(zip(decomposition.B, self.X.shapes)):
+            if B.shape[0] != slice_shape[1]:
                 raise ValueError(
                     f"The number of rows of factor matrix B_{k} ({B.shape[0]}"
-                    f"is not the same as the number of columns of X_{k} ({X_slice.shape[1]})"
+                    f"is not the same as the number of columns of X_{k} ({slice_shape[1]})"
                 )
 
             if B.shape[1] != self.rank:
@@ -181,7 +236,7 @@ class BaseParafac2(BaseDecomposer):
 
         Arguments:
         ----------
-        X : np.ndarray
+        X : np.ndarray, list(np.ndarray), tenkit.ragged.RaggedArray, h5py.Group or sequence
             The tensor or list of tensor slices to fit a PARAFAC2 model to. 
             The list indices (or first mode) correspond to the C-mode in
             the following equation
@@ -191,7 +246,16 @@ class BaseParafac2(BaseDecomposer):
                 X_k = A diag(c_k) B_k^T
             
             This will be changed in a later version so that the first mode
-            is the evolving mode.
+            is the evolving mode. A list of slices is copied into a single
+            ``RaggedArray`` (with ``ragged_axis=1``) before fitting.
+
+            Slices that do not fit in memory can be given as a HDF5 group with
+            one dataset per slice, as a ``tenkit.ragged.LazyRaggedArray`` or as 
+            any other sequence that supports ``len(X)`` and ``X[k]``. Then, the 
+            slices are streamed through each iteration in chunks, which are read 
+            by a separate thread while the previous chunk is processed. Only the 
+            factor matrices, projection matrices and the (small) projected 
+            tensor are kept in memory.
         y : None
             Ignored, included to follow sklearn standards.
         max_its : int (optional)
@@ -217,14 +281,48 @@ class BaseParafac2(BaseDecomposer):
 
     @property
     def SSE(self):
-        SSE = 0
-        for X_k, reconstructed_X_k, in zip(self.X, self.reconstructed_X):
-            SSE += np.sum((X_k - reconstructed_X_k)**2)
-        return SSE
+        if self._projected_X_is_current:
+            return self._SSE_from_projected_X()
+
+        # With an unbounded cache, compute all evolving factor matrices before the 
+        # slices are split into chunks. Otherwise, each chunk computes its own rows.
+        if self.decomposition.B.cache_size is None:
+            self.decomposition.B_unfolded
+        self._for_each_slice_chunk(self._compute_slice_SSE)
+        return self._slice_SSE.sum()
+
+    def _SSE_from_projected_X(self):
+        r"""Compute the SSE without reading the slices.
+
+        Only valid if the projected tensor is computed with the current projection
+        matrices and these have orthonormal columns. Then
+        
+        .. math::
+
+            \|X_k - A D_k B^T P_k^T\|^2 = \|X_k\|^2 - \|X_k P_k\|^2 + \|X_k P_k - A D_k B^T\|^2.
+        """
+        residual = np.einsum(
+            'ir, jr, kr -> ijk', self.decomposition.A, self.decomposition.blueprint_B, self.decomposition.C
+        )
+        residual -= self._projected_X
+        return self.X_norm**2 - self.projected_X_norm**2 + np.vdot(residual, residual)
+
+    def _compute_slice_SSE(self, start, stop, X):
+        # The reconstructed slices are stored with the same layout as X
+        scores = self.decomposition.B.unfolded(start, stop)*X.repeat(self.decomposition.C[start:stop])
+        residual = scores@self.decomposition.A.T
+        residual -= X.data
+        self._slice_SSE[start:stop] = RaggedArray(residual, X.offsets).slice_sq_norms()
+
+    @property
+    def num_elements(self):
+        """Number of elements in the (uncompressed) target.
+        """
+        return self.decomposition.num_elements
 
     @property
     def MSE(self):
-        return self.SSE/self.decomposition.num_elements
+        return self.SSE/self.num_elements
         
     @property
     def reconstructed_X(self):
@@ -232,31 +330,178 @@ class BaseParafac2(BaseDecomposer):
     
     @property
     def projected_X(self):
-        I = self.decomposition.A.shape[0]
-        K = self.decomposition.C.shape[0]
-        projected_X = np.empty((I, self.rank, K))
+        """The projected tensor, whose kth frontal slice is :math:`X_k P_k`.
 
-        for k, projection_matrix in enumerate(self.decomposition.projection_matrices):
-            projected_X[..., k] = self.X[k]@projection_matrix
-        return projected_X
+        The returned array is a buffer that is overwritten in place 
+        every time the projected tensor is updated.
+        """
+        self._update_projected_X()
+        return self._projected_X
+
+    @property
+    def projected_X_norm(self):
+        """Frobenius norm of the projected tensor, as of its last update.
+        """
+        return np.sqrt(self._projected_X_slice_sq_norms.sum())
+
+    def _for_each_slice_chunk(self, function, X=None):
+        """Call ``function(start, stop, X_chunk)`` for consecutive chunks of slices that together cover all slices.
+
+        ``X_chunk`` is a ragged array with the slices ``start, ..., stop-1`` of ``X`` 
+        (default ``self.X``). If ``n_threads > 1``, then the chunks are processed by
+        a thread pool. There are several chunks per thread (with roughly the same 
+        number of elements) so that the work is balanced also when the slices have 
+        different sizes. The function should only write to the part of preallocated
+        output that corresponds to its slices.
+        """
+        if X is None:
+            X = self.X
+        chunks = self._iter_slice_chunks(X, self._slice_chunk_bounds(X))
+
+        if self.n_threads is None or self.n_threads <= 1:
+            for chunk in chunks:
+                function(*chunk)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            # Limit the number of loaded chunks that are waiting to be processed
+            futures = deque()
+            for chunk in chunks:
+                if len(futures) >= 2*self.n_threads:
+                    futures.popleft().result()
+                futures.append(executor.submit(function, *chunk))
+
+            # Wait for all chunks so that exceptions are raised
+            for future in futures:
+                future.result()
+
+    def _slice_chunk_bounds(self, X):
+        K = len(X)
+        num_chunks = 1
+        if self.n_threads is not None and self.n_threads > 1:
+            num_chunks = self.n_threads*self._chunks_per_thread
+        if isinstance(X, LazyRaggedArray):
+            # Bound the memory used for the slices that are read from the source
+            num_X_elements = X.offsets[-1]*X.width
+            num_chunks = max(num_chunks, int(np.ceil(num_X_elements/self._max_lazy_chunk_size)))
+        num_chunks = max(1, min(K, num_chunks))
+
+        row_bounds = np.linspace(0, X.offsets[-1], num_chunks + 1)
+        bounds = np.unique(np.searchsorted(X.offsets, row_bounds))
+        bounds[0], bounds[-1] = 0, K
+        return bounds
+
+    def _iter_slice_chunks(self, X, bounds):
+        """Yield ``(start, stop, X_chunk)`` for each pair of consecutive bounds.
+
+        If ``X`` is a ``LazyRaggedArray``, then the chunks are read by a separate
+        thread that prefetches the next chunks while the current chunk is processed.
+        """
+        chunk_bounds = list(zip(bounds[:-1], bounds[1:]))
+        if not isinstance(X, LazyRaggedArray):
+            for start, stop in chunk_bounds:
+                yield start, stop, X.chunk(start, stop)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            loaded_chunks = deque(
+                reader.submit(X.chunk, start, stop) for start, stop in chunk_bounds[:self._num_prefetched_chunks]
+            )
+            for i, (start, stop) in enumerate(chunk_bounds):
+                next_chunk = i + self._num_prefetched_chunks
+                if next_chunk < len(chunk_bounds):
+                    loaded_chunks.append(reader.submit(X.chunk, *chunk_bounds[next_chunk]))
+                yield start, stop, loaded_chunks.popleft().result()
+
+    def _project_slices(self, start, stop, X):
+        projection_matrices = self.decomposition.projection_matrices
+        if X.all_same_size:
+            # One batched matrix product, written directly into the (I, R, K)-shaped buffer
+            np.matmul(
+                X.stacked(),
+                projection_matrices.chunk(start, stop).stacked(),
+                out=self._projected_X.transpose(2, 0, 1)[start:stop]
+            )
+        else:
+            for k, X_k in enumerate(X, start=start):
+                np.matmul(X_k, projection_matrices[k], out=self._projected_X[..., k])
+
+        projected_slices = self._projected_X[..., start:stop]
+        np.einsum(
+            'irk, irk -> k', projected_slices, projected_slices, out=self._projected_X_slice_sq_norms[start:stop]
+        )
+
+    def _update_projected_X(self):
+        """Fill the projected tensor buffer (and the slice norms) in place.
+        """
+        self._for_each_slice_chunk(self._project_slices)
 
     # TODO: Change name of this function
     def _update_projection_matrices(self):
-        K = self.X_shape[2]
+        self._for_each_slice_chunk(self._update_projection_matrices_for_slices)
 
-        for k in range(K):
-            A = self.decomposition.A
-            C = self.decomposition.C
-            blueprint_B = self.decomposition.blueprint_B
+        # The projection matrices are updated in place, so the cached B_k are outdated
+        self.decomposition.B.clear_cache()
+        self._projected_X_is_current = False
 
-            self.decomposition.projection_matrices[k][...] = base.orthogonal_solve(
-                (C[k]*A)@blueprint_B.T,
-                self.X[k]
+    def _update_projection_matrices_and_projected_X(self):
+        """Update the projection matrices and the projected tensor with one pass over the slices.
+        """
+        self._for_each_slice_chunk(self._update_and_project_slices)
+        self.decomposition.B.clear_cache()
+        self._projected_X_is_current = True
+
+    def _update_and_project_slices(self, start, stop, X):
+        self._update_projection_matrices_for_slices(start, stop, X)
+        self._project_slices(start, stop, X)
+
+    def _update_projection_matrices_for_slices(self, start, stop, X):
+        A = self.decomposition.A
+        C = self.decomposition.C[start:stop]
+        blueprint_B = self.decomposition.blueprint_B
+        projection_matrices = self.decomposition.projection_matrices
+
+        # Should_keep = diag([1, 1, ..., 1, 0, 0, ..., 0]) -> the zeros correspond to small singular values
+        # Following Rasmus Bro's PARAFAC2 MATLAB script, which sets P_k = Q_k(Q_k'Q_k)^(-0.5) (line 524)
+        #      Where the power is done by truncating very small singular values (for numerical stability)
+
+        # X_k^T A diag(c_k) B^T, with all X_k^T A computed in one matrix product
+        XtA = RaggedArray(X.data@A, X.offsets)
+        if X.all_same_size:
+            XtM = (XtA.stacked()*C[:, np.newaxis])@blueprint_B.T
+            projection_matrices.chunk(start, stop).stacked()[...] = np.swapaxes(
+                base.orthogonal_solve_from_cross_product(XtM), 1, 2
+            )
+        else:
+            for k in range(stop - start):
+                projection_matrices[start + k][...] = base.orthogonal_solve_from_cross_product(
+                    (XtA[k]*C[k])@blueprint_B.T
+                ).T
+
+    def _update_slices(self, indices, X):
+        """Update the projection matrices and rows of :math:`C` for the given slices.
+        
+        Returns the projected slices, :math:`Y_k = X_k P_k`, as an array of shape (len(indices), I, R).
+        """
+        A = self.decomposition.A
+        blueprint_B = self.decomposition.blueprint_B
+        C = self.decomposition.C
+        projection_matrices = self.decomposition.projection_matrices
+
+        XtA = RaggedArray(X.data@A, X.offsets)
+        projected_X = np.empty((len(indices), A.shape[0], self.rank))
+        for i, (k, X_k) in enumerate(zip(indices, X)):
+            projection_matrices[k][...] = base.orthogonal_solve_from_cross_product(
+                (XtA[i]*C[k])@blueprint_B.T
             ).T
+            np.matmul(X_k, projection_matrices[k], out=projected_X[i])
+        self._projected_X_is_current = False
 
-            # Should_keep = diag([1, 1, ..., 1, 0, 0, ..., 0]) -> the zeros correspond to small singular values
-            # Following Rasmus Bro's PARAFAC2 MATLAB script, which sets P_k = Q_k(Q_k'Q_k)^(-0.5) (line 524)
-            #      Where the power is done by truncating very small singular values (for numerical stability)
+        # The rows of C are given by (A^T A * B^T B) c_k = diag(A^T Y_k B)
+        lhs = (A.T@A)*(blueprint_B.T@blueprint_B)
+        rhs = np.einsum('ir, kij, jr -> kr', A, projected_X, blueprint_B)
+        C[indices] = np.linalg.solve(lhs, rhs.T).T
+        return projected_X
 
 
 class Parafac2_ALS(BaseParafac2):
@@ -306,6 +551,12 @@ class Parafac2_ALS(BaseParafac2):
     print_frequency: int (optional, default=None)
         How often convergence information should be printed in the terminal.
         None and negative values leads to no printing.
+    n_threads: int (optional, default=1)
+        Number of threads used for the work that is done separately for each 
+        slice (updating the projection matrices, computing the projected tensor,
+        :math:`X_k P_k`, and computing the loss). The slices are split into chunks 
+        with roughly the same number of elements that are processed by a thread
+        pool. If 1, then no thread pool is used.
     cp_updates_per_it: int (optional, default=5)
         Number of CP iterations to run between each projection matrix update.
     non_negativity_constraints: list(bool) (optional, default=None)
@@ -327,6 +578,19 @@ class Parafac2_ALS(BaseParafac2):
         If nth element in the list is True, the nth mode is constrained to be
         orthonormal. If None, no modes are constrained. Note: all modes should not be
         orhtonormal and the evolving mode cannot be constrained. 
+    compress_slices: bool (optional, default=False)
+        If True, then each slice :math:`X_k` with more columns than rows is
+        replaced by the :math:`I \times I` matrix :math:`R_k^T` from the thin QR
+        decomposition :math:`X_k^T = Q_k R_k` before fitting. This does not
+        change the solution since :math:`P_k = Q_k \tilde{P}_k`, where 
+        :math:`\tilde{P}_k` is the projection matrix of the compressed slice 
+        (see Kiers, HAL et al. J. Chemometrics 13, p.275-299 (1999)). The 
+        full projection matrices are reconstructed once the fit is finished.
+        Useful when the slices are much wider than they are tall. If the 
+        slices are read lazily (e.g. from a HDF5 group), then the compressed
+        slices are kept in memory so that the fit does not read the full slices,
+        and the bases, :math:`Q_k`, are recomputed from the full slices when 
+        the full projection matrices are needed instead of being stored.
     """
     def __init__(
         self,
@@ -342,6 +606,8 @@ class Parafac2_ALS(BaseParafac2):
         non_negativity_constraints=None,
         ridge_penalties=None,
         orthonormality_constraints=None,
+        n_threads=1,
+        compress_slices=False,
     ):
         super().__init__(
             rank,
@@ -352,6 +618,7 @@ class Parafac2_ALS(BaseParafac2):
             checkpoint_frequency=checkpoint_frequency,
             checkpoint_path=checkpoint_path,
             print_frequency=print_frequency,
+            n_threads=n_threads,
         )
         self.non_negativity_constraints = non_negativity_constraints
         if self.non_negativity_constraints is None:
@@ -366,13 +633,134 @@ class Parafac2_ALS(BaseParafac2):
         self.cp_updates_per_it = cp_updates_per_it
         self.ridge_penalties = ridge_penalties
         self.orthonormality_constraints = orthonormality_constraints
+        self.compress_slices = compress_slices
+        self._is_compressed = False
+
+    def set_target(self, X):
+        super().set_target(X)
+        self._is_compressed = False
+        if self.compress_slices:
+            self._compute_compressed_slices()
+
+    def _compute_compressed_slices(self):
+        """Compute the QR-compressed slices, :math:`R_k^T`, and the bases, :math:`Q_k`.
+
+        Slices with at most as many columns as rows are not compressed and have
+        ``None`` as basis.
+        """
+        self._uncompressed_X = self.X
+        self._uncompressed_X_shape = self.X_shape
+
+        I = self.X_shape[0]
+        compressed_lengths = np.minimum(self.X.lengths, I)
+        self._compressed_X = RaggedArray(
+            np.empty((compressed_lengths.sum(), I)), np.cumsum([0, *compressed_lengths]), ragged_axis=1
+        )
+        # The bases are recomputed when they are needed if the slices are not in memory
+        self._slice_bases = None if isinstance(self.X, LazyRaggedArray) else [None]*len(self.X)
+        self._for_each_slice_chunk(self._compress_slices)
+
+        self._compressed_X_shape = [
+            self.X_shape[0], self._compressed_X.lengths.tolist(), self.X_shape[2]
+        ]
+
+    def _compress_slices(self, start, stop, X):
+        for k, X_k in enumerate(X, start=start):
+            Q_k, compressed_X_k = self._compress_slice(X_k)
+            self._compressed_X[k] = compressed_X_k
+            if self._slice_bases is not None:
+                self._slice_bases[k] = Q_k
+
+    @staticmethod
+    def _compress_slice(X_k):
+        """Returns :math:`Q_k` and :math:`R_k^T`, where :math:`X_k^T = Q_k R_k`. 
+        
+        Slices with at most as many columns as rows are not compressed and ``(None, X_k)`` is returned.
+        """
+        if X_k.shape[1] <= X_k.shape[0]:
+            return None, X_k
+        Q_k, R_k = np.linalg.qr(X_k.T)
+        return Q_k, R_k.T
+
+    def _map_slice_bases(self, function):
+        """Returns a list with ``function(Q_k, P_k)`` for each slice.
+
+        :math:`Q_k` is the basis of the kth compressed slice (None if it is not
+        compressed) and :math:`P_k` is the kth projection matrix of the current 
+        decomposition.
+        """
+        projection_matrices = self.decomposition.projection_matrices
+        if self._slice_bases is not None:
+            return [function(Q_k, P_k) for Q_k, P_k in zip(self._slice_bases, projection_matrices)]
+
+        # Recompute the bases from the full slices (the QR decomposition is deterministic)
+        mapped = [None]*len(projection_matrices)
+        def map_chunk(start, stop, X):
+            for k, X_k in enumerate(X, start=start):
+                Q_k, _ = self._compress_slice(X_k)
+                mapped[k] = function(Q_k, projection_matrices[k])
+
+        self._for_each_slice_chunk(map_chunk, X=self._uncompressed_X)
+        return mapped
+
+    def _compress_target(self):
+        """Use the compressed slices as target and compress the projection matrices.
+        """
+        projection_matrices = self._map_slice_bases(lambda Q_k, P_k: P_k if Q_k is None else Q_k.T@P_k)
+        self._uncompressed_num_elements = self.decomposition.num_elements
+        self.X = self._compressed_X
+        self.X_shape = self._compressed_X_shape
+        self.decomposition = self._with_projection_matrices(projection_matrices)
+        self._is_compressed = True
+        self._projected_X_is_current = False
+
+    def _uncompress_target(self):
+        """Use the full slices as target and reconstruct the full projection matrices.
+        """
+        self.decomposition = self._uncompressed_decomposition()
+        self.X = self._uncompressed_X
+        self.X_shape = self._uncompressed_X_shape
+        self._is_compressed = False
+        self._projected_X_is_current = False
+
+    @property
+    def num_elements(self):
+        """Number of elements in the uncompressed target, also while the compressed slices are used.
+        """
+        if self._is_compressed:
+            return self._uncompressed_num_elements
+        return super().num_elements
+
+    def _uncompressed_decomposition(self):
+        projection_matrices = self._map_slice_bases(lambda Q_k, P_k: P_k if Q_k is None else Q_k@P_k)
+        return self._with_projection_matrices(projection_matrices)
+
+    def _with_projection_matrices(self, projection_matrices):
+        """Parafac2 tensor that shares all factor matrices except the projections with current decomposition.
+        """
+        return self.DecompositionType(
+            self.decomposition.A,
+            self.decomposition.blueprint_B,
+            self.decomposition.C,
+            projection_matrices,
+            warning=self.decomposition.warning,
+        )
+
+    def store_checkpoint(self):
+        if not self._is_compressed:
+            return super().store_checkpoint()
+
+        compressed_decomposition = self.decomposition
+        self.decomposition = self._uncompressed_decomposition()
+        super().store_checkpoint()
+        self.decomposition = compressed_decomposition
 
     def _init_fit(self, X, max_its, initial_decomposition):
         super()._init_fit(X=X, max_its=max_its, initial_decomposition=initial_decomposition)
         self.prev_loss = self.loss
         self._rel_function_change = np.inf
 
-    def _prepare_cp_decomposer(self):
+    def _prepare_cp_decomposer(self, update_projected_X=True):
         self.cp_decomposition = decompositions.KruskalTensor([self.decomposition.A, self.decomposition.blueprint_B, self.decomposition.C])
         self.cp_decomposer = cp.CP_ALS(
             self.rank,
@@ -384,9 +772,13 @@ class Parafac2_ALS(BaseParafac2):
             orthonormality_constraints=self.orthonormality_constraints,
             init='precomputed'
         )
-        self.cp_decomposer._init_fit(X=self.projected_X, max_its=np.inf, initial_decomposition=self.cp_decomposition)
+        if update_projected_X:
+            self._update_projected_X()
+        self.cp_decomposer._init_fit(X=self._projected_X, max_its=np.inf, initial_decomposition=self.cp_decomposition)
 
     def _fit(self):
+        if self.compress_slices:
+            self._compress_target()
 
         self._prepare_cp_decomposer()
         for it in range(self.max_its - self.current_iteration):
@@ -402,6 +794,8 @@ class Parafac2_ALS(BaseParafac2):
 
             self._after_fit_iteration()
 
+        if self.compress_slices:
+            self._uncompress_target()
 
         if (
             ((self.current_iteration+1) % self.checkpoint_frequency != 0) and 
@@ -417,19 +811,136 @@ class Parafac2_ALS(BaseParafac2):
     def _update_parafac2_factors(self):
         #print('Before projection update') 
         #print(f'The MSE is {self.MSE: 4f}, f is {self.loss:4f}')
-        self._update_projection_matrices()
+        if isinstance(self.X, LazyRaggedArray):
+            # Read each slice only once per iteration. The loss is then computed 
+            # from the projected tensor, so the slices are not read again.
+            self._update_projection_matrices_and_projected_X()
+        else:
+            self._update_projection_matrices()
+            self._update_projected_X()
+            self._projected_X_is_current = True
 
         #print('Before ALS update') 
         #print(f'The MSE is {self.MSE: 4f}, f is {self.loss:4f}')
 
-        self.cp_decomposer.set_target(self.projected_X)
+        self._update_cp_factors()
+        #print('After iteration') 
+        #print(f'The MSE is {self.MSE: 4f}, f is {self.loss:4f}')
+        # from pdb import set_trace; set_trace()
+
+    def _update_cp_factors(self):
+        # The CP decomposer already points to the projected tensor buffer, so we 
+        # only update its norm, which is computed while projecting the slices
+        self.cp_decomposer.set_target(self._projected_X, X_norm=self.projected_X_norm)
         for _ in range(self.cp_updates_per_it):
             self.cp_decomposer._update_als_factors()
         self.decomposition.blueprint_B[...] *= self.cp_decomposer.weights
+        self.decomposition.B.clear_cache()
         self.cp_decomposition.weights = self.cp_decomposition.weights*0 + 1
-        #print('After iteration') 
-        #print(f'The MSE is {self.MSE: 4f}, f is {self.loss:4f}')
-        # from pdb import set_trace; set_trace()
+
+    def partial_fit(self, new_slices, num_sweeps=5, num_slice_updates=5):
+        """Update a fitted model with new frontal slices.
+
+        First, the projection matrices and rows of :math:`C` for the new slices are
+        estimated with :math:`A` and the blueprint matrix fixed (alternating 
+        ``num_slice_updates`` times between the projection matrices and the rows of 
+        :math:`C`). Then, ``num_sweeps`` warm-started sweeps are run, where each sweep
+        updates the projection matrices of the new slices and runs ``cp_updates_per_it``
+        CP iterations on the projected tensor. The projected slices, :math:`X_k P_k`, 
+        of the previously fitted slices are the sufficient statistics for the CP 
+        iterations, so they are reused instead of being recomputed. Call ``continue_fit``
+        afterwards to also refine the projection matrices of the old slices.
+
+        The decomposition is extended in place. If the model is not fitted yet, 
+        then it is fitted to the new slices.
+
+        Arguments:
+        ----------
+        new_slices : np.ndarray, list(np.ndarray) or tenkit.ragged.RaggedArray
+            The new slices, on the same form as the input to ``fit``. Must be in memory.
+        num_sweeps : int (optional, default=5)
+            Number of warm-started sweeps.
+        num_slice_updates : int (optional, default=5)
+            Number of alternating updates of the new projection matrices and rows of
+            :math:`C` before the sweeps.
+        """
+        if not hasattr(self, 'decomposition'):
+            self.fit(new_slices)
+            return
+
+        if isinstance(self.X, LazyRaggedArray):
+            raise ValueError('`partial_fit` is only supported when the slices are stored in memory.')
+        
+        new_X = _as_ragged_slices(new_slices)
+        if isinstance(new_X, LazyRaggedArray):
+            raise ValueError('`partial_fit` is only supported when the new slices are stored in memory.')
+        if new_X.width != self.X_shape[0]:
+            raise ValueError(
+                f'The new slices must have {self.X_shape[0]} rows, not {new_X.width}.'
+            )
+
+        num_old_slices = len(self.X)
+        new_indices = np.arange(num_old_slices, num_old_slices + len(new_X))
+        self._append_target(new_X)
+
+        # Start with average loadings for the new slices (the projection matrices are 
+        # overwritten before they are used)
+        new_projection_matrices = RaggedArray(np.zeros((new_X.offsets[-1], self.rank)), new_X.offsets)
+        new_C = np.repeat(self.decomposition.C.mean(axis=0, keepdims=True), len(new_X), axis=0)
+        self.decomposition.append_slices(new_projection_matrices, new_C)
+
+        for _ in range(num_slice_updates):
+            self._update_new_slices(new_indices, new_X)
+        self.decomposition.B.clear_cache()
+
+        self._prepare_cp_decomposer(update_projected_X=False)
+        for _ in range(num_sweeps):
+            self._update_new_slices(new_indices, new_X)
+            self._update_cp_factors()
+
+        # All projected slices are computed with the current (orthonormal) projection matrices
+        self._projected_X_is_current = True
+        self.prev_loss = self.loss
+        self._rel_function_change = np.inf
+
+    def _append_target(self, new_X):
+        """Append slices to the target and extend the buffers, keeping the old projected slices.
+        """
+        num_old_slices = len(self.X)
+        old_projected_X = self._projected_X
+        old_projected_X_slice_sq_norms = self._projected_X_slice_sq_norms
+
+        self.X = self.X.concatenate(new_X)
+        self.X_shape = [self.X.width, self.X.lengths.tolist(), len(self.X)]
+        self.X_norm = np.sqrt(self.X_norm**2 + new_X.norm()**2)
+        self.num_X_elements = sum([np.prod(s) for s in self.X_shape])
+        self.target_tensor = None
+
+        self._allocate_slice_buffers()
+        self._projected_X[..., :num_old_slices] = old_projected_X
+        self._projected_X_slice_sq_norms[:num_old_slices] = old_projected_X_slice_sq_norms
+
+        if self.compress_slices:
+            self._append_compressed_slices(new_X)
+
+    def _append_compressed_slices(self, new_X):
+        new_bases, new_compressed_X = zip(*[self._compress_slice(X_k) for X_k in new_X])
+        self._compressed_X = self._compressed_X.concatenate(
+            RaggedArray.from_list(new_compressed_X, ragged_axis=1)
+        )
+        self._slice_bases.extend(new_bases)
+        self._compressed_X_shape = [
+            self.X_shape[0], self._compressed_X.lengths.tolist(), self.X_shape[2]
+        ]
+        self._uncompressed_X = self.X
+        self._uncompressed_X_shape = self.X_shape
+
+    def _update_new_slices(self, indices, X):
+        """Update the projection matrices, rows of C and projected slices for the given slices.
+        """
+        projected_X = self._update_slices(indices, X)
+        self._projected_X[..., indices] = projected_X.transpose(1, 2, 0)
+        self._projected_X_slice_sq_norms[indices] = np.einsum('kir, kir -> k', projected_X, projected_X)
 
     @property
     def loss(self):
@@ -439,3 +950,268 @@ class Parafac2_ALS(BaseParafac2):
             for factor, penalty in zip(factor_matrices, self.ridge_penalties):
                 loss += penalty*np.linalg.norm(factor)**2
         return loss
+
+
+class Parafac2_SALS(BaseParafac2):
+    r"""Decomposer for Parafac2 with stochastic (minibatch) ALS optimization.
+
+    Each iteration samples a random minibatch of slices. The projection 
+    matrices and the rows of :math:`C` that correspond to the sampled slices are 
+    updated exactly, and the sampled projected slices, :math:`Y_k = X_k P_k`, are
+    used to update running averages of the normal equations (sufficient statistics)
+    for :math:`A` and the blueprint matrix, :math:`B`:
+
+    .. math::
+
+        G_A &\leftarrow (1 - \rho_t) G_A + \rho_t \frac{K}{|S|} (B^T B) * (C_S^T C_S), \\
+        M_A &\leftarrow (1 - \rho_t) M_A + \rho_t \frac{K}{|S|} \sum_{k \in S} Y_k B \text{diag}(\mathbf{c}_k),
+
+    and :math:`A = M_A G_A^{-1}` (and similarly for :math:`B`). The step size is
+    :math:`\rho_t = (t + t_0)^{-\kappa}`, where :math:`t_0` is ``step_size_offset``
+    and :math:`\kappa` is ``step_size_decay``. With :math:`\kappa \in (0.5, 1]` 
+    the statistics are a weighted average over all minibatches, where recent
+    minibatches have more weight.
+
+    The slices in a held-out sample are never used to update :math:`A` and 
+    :math:`B`. Instead, the exact loss on the held-out sample is computed 
+    periodically (after updating the projection matrices and rows of :math:`C` 
+    for the held-out slices) and used to check convergence. 
+
+    Arguments:
+    ----------
+    rank: int
+        Number of components 
+    max_its: int (optional, default=1000)
+        Maximum number of minibatch iterations for fitting the model. 
+        Can be overwritten by the ``fit`` method.
+    convergence_tol: float (optional, default=1e-6)
+        Minimum relative change of the held-out loss between two consequetive
+        evaluations for the model to continue fitting.
+    init: str (optional, default = 'random')
+        Initialisation scheme for the decomposer (case insensitive). 
+        See ``Parafac2_ALS`` for the options.
+    logger: list(Logger) (optional, default=None)
+        List of loggers, each logger should implement a ``log`` method
+        that takes a decomposer as input and a ``write_to_hdf5_group``
+        method that stores the log in a hdf5 group. See 
+        ``tenkit.logging.BaseLogger`` for interface.
+    checkpoint_frequency: int (optional, default=None)
+        How often the decomposer should store the decomposition and
+        logs to disk. If None or negative, will only
+        checkpoint the last iteration. 
+    checkpoint_path: str or Path (optional, default=None)
+        Where to store the log HDF5 file. If None, then the checkpoints
+        and logs are not stored to disk.
+    print_frequency: int (optional, default=None)
+        How often convergence information should be printed in the terminal.
+        None and negative values leads to no printing.
+    n_threads: int (optional, default=1)
+        Number of threads used for the final pass over all slices. If 1, then 
+        no thread pool is used.
+    batch_size: int (optional, default=100)
+        Number of slices in each minibatch.
+    validation_size: int (optional, default=None)
+        Number of held-out slices used to compute the loss. If None, then
+        10% of the slices are held out, but no more than 100 slices.
+    validation_frequency: int (optional, default=10)
+        How many minibatch iterations there are between each time the held-out 
+        loss is computed.
+    step_size_offset: float (optional, default=1)
+        Offset, :math:`t_0`, of the step size schedule. Larger values give smaller
+        (more conservative) steps in the first iterations.
+    step_size_decay: float (optional, default=0.6)
+        Decay rate, :math:`\kappa`, of the step size schedule.
+    final_sweep: bool (optional, default=True)
+        If True, then the projection matrices and the rows of :math:`C` are updated
+        for all slices (one pass over the data) once the minibatch iterations are
+        finished. Otherwise, slices that were not sampled in the last iterations
+        may have outdated projection matrices and rows of :math:`C`.
+    """
+    def __init__(
+        self,
+        rank,
+        max_its=1000, 
+        convergence_tol=1e-6, 
+        init='random',
+        loggers=None,
+        checkpoint_frequency=None,
+        checkpoint_path=None,
+        print_frequency=10,
+        n_threads=1,
+        batch_size=100,
+        validation_size=None,
+        validation_frequency=10,
+        step_size_offset=1,
+        step_size_decay=0.6,
+        final_sweep=True,
+    ):
+        super().__init__(
+            rank,
+            max_its=max_its,
+            convergence_tol=convergence_tol,
+            init=init,
+            loggers=loggers,
+            checkpoint_frequency=checkpoint_frequency,
+            checkpoint_path=checkpoint_path,
+            print_frequency=print_frequency,
+            n_threads=n_threads,
+        )
+        self.batch_size = batch_size
+        self.validation_size = validation_size
+        self.validation_frequency = validation_frequency
+        self.step_size_offset = step_size_offset
+        self.step_size_decay = step_size_decay
+        self.final_sweep = final_sweep
+
+    def _allocate_slice_buffers(self):
+        # The projected tensor is only formed for one minibatch at the time, the 
+        # buffers for all slices are allocated the first time it is read
+        self._slice_SSE = np.empty(self.X_shape[2])
+        self._projected_X = None
+
+    @property
+    def projected_X(self):
+        """The projected tensor, whose kth frontal slice is :math:`X_k P_k`.
+
+        The fit only forms the projected slices of one minibatch at the time, so the
+        projected tensor is computed with a pass over all slices every time it is read.
+        """
+        if self._projected_X is None:
+            I, K = self.X_shape[0], self.X_shape[2]
+            self._projected_X = np.empty((I, self.rank, K))
+            self._projected_X_slice_sq_norms = np.empty(K)
+        return super().projected_X
+
+    @property
+    def projected_X_norm(self):
+        """Frobenius norm of the projected tensor, computed with a pass over all slices.
+        """
+        self.projected_X
+        return super().projected_X_norm
+
+    def _init_fit(self, X, max_its, initial_decomposition):
+        super()._init_fit(X=X, max_its=max_its, initial_decomposition=initial_decomposition)
+
+        K = self.X_shape[2]
+        validation_size = self.validation_size
+        if validation_size is None:
+            validation_size = min(100, max(1, K//10))
+        if validation_size >= K:
+            raise ValueError(
+                f'The validation size ({validation_size}) must be smaller than the number of slices ({K}).'
+            )
+
+        permutation = np.random.permutation(K)
+        self._held_out_indices = np.sort(permutation[:validation_size])
+        self._training_indices = np.sort(permutation[validation_size:])
+        self._held_out_X = self.X.take(self._held_out_indices)
+
+        self._A_statistics = None
+        self._B_statistics = None
+        self.prev_loss = self._compute_held_out_SSE()
+        self._held_out_SSE = self.prev_loss
+        self._rel_function_change = np.inf
+
+    @property
+    def loss(self):
+        """The held-out SSE, as of the last time it was computed.
+        """
+        return self._held_out_SSE
+
+    @property
+    def step_size(self):
+        return (self.current_iteration + self.step_size_offset)**(-self.step_size_decay)
+
+    def _sample_batch(self):
+        batch_size = min(self.batch_size, len(self._training_indices))
+        indices = np.sort(np.random.choice(self._training_indices, size=batch_size, replace=False))
+        return indices, self.X.take(indices)
+
+    def _fit(self):
+        # The next minibatch is read by a separate thread while the current minibatch is processed
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            next_batch = reader.submit(self._sample_batch)
+            for it in range(self.max_its - self.current_iteration):
+                if abs(self._rel_function_change) < self.convergence_tol:
+                    break
+
+                indices, X = next_batch.result()
+                next_batch = reader.submit(self._sample_batch)
+                self._update_parafac2_factors(indices, X)
+                if (self.current_iteration + 1) % self.validation_frequency == 0:
+                    self._update_convergence()
+
+                if self.current_iteration % self.print_frequency == 0 and self.print_frequency > 0:
+                    print(f'{self.current_iteration:6d}: The held-out SSE is {self.loss:4g}, '
+                          f'improvement is {self._rel_function_change:g}')
+
+                self._after_fit_iteration()
+
+        if self.final_sweep:
+            self._for_each_slice_chunk(self._update_slices_in_chunk)
+            self.decomposition.B.clear_cache()
+
+        if (
+            ((self.current_iteration+1) % self.checkpoint_frequency != 0) and 
+            (self.checkpoint_frequency > 0)
+        ):
+            self.store_checkpoint()
+
+    def _update_convergence(self):
+        self._held_out_SSE = self._compute_held_out_SSE()
+        self._rel_function_change = (self.prev_loss - self._held_out_SSE)/self.prev_loss
+        self.prev_loss = self._held_out_SSE
+
+    def _compute_held_out_SSE(self):
+        """Update the projection matrices and rows of C for the held-out slices and return their SSE.
+        """
+        self._update_slices(self._held_out_indices, self._held_out_X)
+        self.decomposition.B.clear_cache()
+
+        A = self.decomposition.A
+        blueprint_B = self.decomposition.blueprint_B
+        C = self.decomposition.C
+        projection_matrices = self.decomposition.projection_matrices
+        SSE = 0
+        for k, X_k in zip(self._held_out_indices, self._held_out_X):
+            B_k = projection_matrices[k]@blueprint_B
+            SSE += np.linalg.norm(X_k - (A*C[k])@B_k.T)**2
+        return SSE
+
+    def _update_slices_in_chunk(self, start, stop, X):
+        self._update_slices(np.arange(start, stop), X)
+
+    def _update_statistics(self, statistics, lhs, rhs):
+        if statistics is None:
+            return lhs, rhs
+
+        step_size = self.step_size
+        prev_lhs, prev_rhs = statistics
+        return (1 - step_size)*prev_lhs + step_size*lhs, (1 - step_size)*prev_rhs + step_size*rhs
+
+    def _update_parafac2_factors(self, indices, X):
+        projected_X = self._update_slices(indices, X)
+        C = self.decomposition.C[indices]
+        CtC = C.T@C
+
+        # Scale the minibatch statistics so that they estimate the statistics of all slices
+        scale = len(self._training_indices)/len(indices)
+
+        blueprint_B = self.decomposition.blueprint_B
+        self._A_statistics = self._update_statistics(
+            self._A_statistics,
+            scale*(blueprint_B.T@blueprint_B)*CtC,
+            scale*np.einsum('kij, jr, kr -> ir', projected_X, blueprint_B, C),
+        )
+        lhs, rhs = self._A_statistics
+        self.decomposition.A[...] = np.linalg.solve(lhs.T, rhs.T).T
+
+        A = self.decomposition.A
+        self._B_statistics = self._update_statistics(
+            self._B_statistics,
+            scale*(A.T@A)*CtC,
+            scale*np.einsum('kij, ir, kr -> jr', projected_X, A, C),
+        )
+        lhs, rhs = self._B_statistics
+        self.decomposition.blueprint_B[...] = np.linalg.solve(lhs.T, rhs.T).T
+        self.decomposition.B.clear_cache()
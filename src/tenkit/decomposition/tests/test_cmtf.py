@@ -4,14 +4,16 @@ import tempfile
 import h5py
 import pytest
 import numpy as np
+import scipy.sparse
 from tenkit.decomposition import cp
 from tenkit.decomposition import decompositions
 from tenkit import metrics
+from tenkit import base
 from tenkit.decomposition import cmtf
 
 np.random.seed(0)
 
-#TODO: test coupling on different modes and more than one mode
+#TODO: test coupling on different modes
 
 class TestCMTFALS:
     @pytest.fixture
@@ -50,3 +52,185 @@ class TestCMTFALS:
         assert metrics.factor_match_score(
             rank4_kruskal_tensor.factor_matrices, estimated_ktensor.factor_matrices, weight_penalty=False
         )[0] > 1-1e-9
+
+    def test_coupled_update_solves_concatenated_least_squares_problem(self, rank4_kruskal_tensor, rank4_coupled_matrix_factors):
+        X = rank4_kruskal_tensor.construct_tensor()
+        A, V = rank4_coupled_matrix_factors
+        Y = A @ V.T
+
+        cmtf_decomposer = cmtf.CMTF_ALS(4, max_its=5, print_frequency=-1)
+        cmtf_decomposer.fit(X, [Y], [0])
+        factor_matrices = cmtf_decomposer.factor_matrices
+        V_estimate = cmtf_decomposer.uncoupled_factor_matrices[0]
+
+        khatri_rao_product = base.khatri_rao(*factor_matrices, skip=0)
+        concatenated_lhs = np.concatenate([khatri_rao_product, V_estimate], axis=0)
+        concatenated_rhs = np.concatenate([base.unfold(X, 0), Y], axis=1)
+        expected_A = np.linalg.lstsq(concatenated_lhs, concatenated_rhs.T, rcond=None)[0].T
+
+        cmtf_decomposer._update_als_factor(0)
+        assert np.allclose(factor_matrices[0], expected_A)
+
+    def test_SSE_equals_reconstructed_SSE(self, rank4_kruskal_tensor, rank4_coupled_matrix_factors):
+        X = rank4_kruskal_tensor.construct_tensor()
+        A, V = rank4_coupled_matrix_factors
+        Y = A @ V.T + 0.1*np.random.standard_normal((30, 45))
+
+        def reconstructed_SSE(decomposer):
+            SSE = np.linalg.norm(X - decomposer.reconstructed_X)**2
+            for Y, reconstructed_Y in zip(decomposer.coupled_matrices, decomposer.reconstructed_coupled_matrices):
+                SSE += np.linalg.norm(Y - reconstructed_Y)**2
+            return SSE
+
+        cmtf_decomposer = cmtf.CMTF_ALS(4, max_its=5, print_frequency=-1)
+        cmtf_decomposer.fit(X, [Y], [0])
+        assert np.allclose(cmtf_decomposer.SSE, reconstructed_SSE(cmtf_decomposer))
+
+        for mode in range(3):
+            cmtf_decomposer._update_als_factor(mode)
+            assert np.allclose(cmtf_decomposer.SSE, reconstructed_SSE(cmtf_decomposer))
+        cmtf_decomposer._update_uncoupled_matrix_factors()
+        assert np.allclose(cmtf_decomposer.SSE, reconstructed_SSE(cmtf_decomposer))
+
+    def test_sparse_coupled_matrix_gives_same_decomposition_as_dense(self, rank4_kruskal_tensor, rank4_coupled_matrix_factors):
+        X = rank4_kruskal_tensor.construct_tensor()
+        A, V = rank4_coupled_matrix_factors
+        Y = A @ V.T
+        Y[np.abs(Y) < 1] = 0
+        sparse_Y = scipy.sparse.coo_matrix(Y)
+
+        decompositions_ = []
+        for coupled_matrix in [Y, sparse_Y]:
+            np.random.seed(1)
+            cmtf_decomposer = cmtf.CMTF_ALS(4, max_its=20, print_frequency=-1)
+            cmtf_decomposer.fit(X, [coupled_matrix], [0])
+            decompositions_.append(cmtf_decomposer)
+
+        dense_decomposer, sparse_decomposer = decompositions_
+        assert scipy.sparse.issparse(sparse_decomposer.coupled_matrices[0])
+        assert np.allclose(dense_decomposer.SSE, sparse_decomposer.SSE)
+        for dense_fm, sparse_fm in zip(dense_decomposer.factor_matrices, sparse_decomposer.factor_matrices):
+            assert np.allclose(dense_fm, sparse_fm)
+        assert np.allclose(dense_decomposer.uncoupled_factor_matrices[0], sparse_decomposer.uncoupled_factor_matrices[0])
+
+    def test_sparse_non_negative_uncoupled_update_equals_dense_update(self):
+        U = np.random.standard_normal((30, 4))
+        Y = np.random.uniform(size=(30, 20))
+        Y[Y < 0.8] = 0
+
+        dense_V = base.non_negative_rightsolve(U.T, Y.T)
+        sparse_V = cmtf.CMTF_ALS._sparse_non_negative_uncoupled_update(U, scipy.sparse.csr_matrix(Y).T@U)
+        assert np.allclose(dense_V, sparse_V)
+
+    def test_non_negative_fit_with_sparse_coupled_matrix(self):
+        ktensor = decompositions.KruskalTensor.random_init((30, 40, 50), rank=4, random_method='uniform')
+        X = ktensor.construct_tensor()
+        V = np.random.uniform(size=(45, 4))
+        Y = ktensor.factor_matrices[0] @ V.T
+        Y[Y < np.median(Y)] = 0
+        sparse_Y = scipy.sparse.csr_matrix(Y)
+
+        decompositions_ = []
+        for coupled_matrix in [Y, sparse_Y]:
+            np.random.seed(1)
+            cmtf_decomposer = cmtf.CMTF_ALS(
+                4, max_its=20, print_frequency=-1, non_negativity_constraints=[True, True, True]
+            )
+            cmtf_decomposer.fit(X, [coupled_matrix], [0])
+            decompositions_.append(cmtf_decomposer)
+
+        dense_decomposer, sparse_decomposer = decompositions_
+        assert scipy.sparse.issparse(sparse_decomposer.coupled_matrices[0])
+        for factor_matrix in [*sparse_decomposer.factor_matrices, *sparse_decomposer.uncoupled_factor_matrices]:
+            assert np.all(factor_matrix >= 0)
+
+        assert np.allclose(dense_decomposer.SSE, sparse_decomposer.SSE)
+        assert np.allclose(dense_decomposer.uncoupled_factor_matrices[0], sparse_decomposer.uncoupled_factor_matrices[0])
+        for dense_fm, sparse_fm in zip(dense_decomposer.factor_matrices, sparse_decomposer.factor_matrices):
+            assert np.allclose(dense_fm, sparse_fm)
+
+    @pytest.mark.parametrize("n_threads", [1, 2])
+    def test_two_coupled_matrices_on_same_mode(self, rank4_kruskal_tensor, rank4_coupled_matrix_factors, n_threads):
+        X = rank4_kruskal_tensor.construct_tensor()
+        A, V1 = rank4_coupled_matrix_factors
+        V2 = np.random.standard_normal((25, 4))
+        Y1 = A @ V1.T
+        Y2 = A @ V2.T
+
+        cmtf_decomposer = cmtf.CMTF_ALS(4, max_its=5, print_frequency=-1, n_threads=n_threads)
+        cmtf_decomposer.fit(X, [Y1, Y2], [0, 0])
+        factor_matrices = cmtf_decomposer.factor_matrices
+        V1_estimate, V2_estimate = cmtf_decomposer.uncoupled_factor_matrices
+
+        khatri_rao_product = base.khatri_rao(*factor_matrices, skip=0)
+        concatenated_lhs = np.concatenate([khatri_rao_product, V1_estimate, V2_estimate], axis=0)
+        concatenated_rhs = np.concatenate([base.unfold(X, 0), Y1, Y2], axis=1)
+        expected_A = np.linalg.lstsq(concatenated_lhs, concatenated_rhs.T, rcond=None)[0].T
+
+        cmtf_decomposer._update_als_factor(0)
+        assert np.allclose(factor_matrices[0], expected_A)
+
+        SSE = np.linalg.norm(X - cmtf_decomposer.reconstructed_X)**2
+        for Y, reconstructed_Y in zip(cmtf_decomposer.coupled_matrices, cmtf_decomposer.reconstructed_coupled_matrices):
+            SSE += np.linalg.norm(Y - reconstructed_Y)**2
+        assert np.allclose(cmtf_decomposer.SSE, SSE)
+
+
+class TestCMTFOPT:
+    @pytest.fixture
+    def rank3_coupled_problem(self):
+        ktensor = decompositions.KruskalTensor.random_init((10, 11, 12), rank=3)
+        A = ktensor.factor_matrices[0]
+        V = np.random.standard_normal((13, 3))
+        return ktensor.construct_tensor(), A @ V.T
+
+    def test_gradient_equals_finite_differences(self, rank3_coupled_problem):
+        X, Y = rank3_coupled_problem
+        cmtf_decomposer = cmtf.CMTF_OPT(3, max_its=0)
+        cmtf_decomposer.fit(X, [Y], [0])
+
+        parameters = cmtf_decomposer._flatten_parameters()
+        loss, gradient = cmtf_decomposer._loss_and_gradient(parameters)
+        assert np.allclose(loss, cmtf_decomposer.SSE)
+
+        eps = 1e-6
+        for idx in np.random.choice(len(parameters), 20, replace=False):
+            shift = np.zeros_like(parameters)
+            shift[idx] = eps
+            finite_difference = (
+                cmtf_decomposer._loss_and_gradient(parameters + shift)[0]
+                - cmtf_decomposer._loss_and_gradient(parameters - shift)[0]
+            )/(2*eps)
+            assert np.allclose(gradient[idx], finite_difference, rtol=1e-4, atol=1e-5)
+
+    @pytest.mark.parametrize("method", ['L-BFGS-B', 'CG'])
+    def test_rank3_cmtf(self, rank3_coupled_problem, method):
+        X, Y = rank3_coupled_problem
+        Y = scipy.sparse.csr_matrix(Y)
+
+        cmtf_decomposer = cmtf.CMTF_OPT(3, max_its=1000, convergence_tol=1e-14, method=method)
+        cmtf_decomposer.fit(X, [Y], [0])
+
+        estimated_Y = cmtf_decomposer.reconstructed_coupled_matrices[0]
+        assert np.linalg.norm(cmtf_decomposer.reconstructed_X - X) < 1e-3*np.linalg.norm(X)
+        assert np.linalg.norm(estimated_Y - Y) < 1e-3*scipy.sparse.linalg.norm(Y)
+
+    def test_fit_with_callback_that_gets_parameter_vector(self, rank3_coupled_problem, monkeypatch):
+        X, Y = rank3_coupled_problem
+        minimize = scipy.optimize.minimize
+        results = []
+
+        def legacy_minimize(fun, x0, callback, **kwargs):
+            # Like SciPy < 1.11: the callback gets the parameter vector and StopIteration is not caught
+            results.append(minimize(fun, x0, **kwargs))
+            for parameters in [results[0].x, results[0].x]:
+                fun(parameters)
+                callback(parameters.copy())
+            return results[0]
+
+        monkeypatch.setattr(scipy.optimize, 'minimize', legacy_minimize)
+        cmtf_decomposer = cmtf.CMTF_OPT(3, max_its=1000, convergence_tol=1e-14, print_frequency=-1)
+        cmtf_decomposer.fit(X, [Y], [0])
+
+        assert cmtf_decomposer._rel_function_change == 0
+        assert np.allclose(cmtf_decomposer.SSE, results[0].fun)
@@ -117,3 +117,22 @@ class TestCPALS:
                 assert np.allclose(fm1, fm2)
             
             assert np.allclose(cp_als.decomposition.weights, cp_als2.decomposition.weights)
+
+
+class TestCPALSKruskalTarget:
+    @pytest.mark.parametrize("init", ["random", "svd"])
+    def test_fit_kruskal_tensor_equals_fit_dense_tensor(self, init):
+        target = decompositions.KruskalTensor.random_init((10, 11, 12), rank=6)
+        target.weights[...] = np.arange(1, 7)
+        X = target.construct_tensor()
+
+        decompositions_ = []
+        for X_ in [target, X]:
+            np.random.seed(0)
+            cp_decomposer = cp.CP_ALS(3, max_its=20, init=init, print_frequency=-1)
+            decompositions_.append(cp_decomposer.fit_transform(X_))
+            assert np.isclose(cp_decomposer.X_norm, np.linalg.norm(X))
+            assert np.isclose(cp_decomposer.SSE, np.linalg.norm(X - cp_decomposer.reconstructed_X)**2)
+
+        implicit_decomposition, dense_decomposition = decompositions_
+        assert np.allclose(implicit_decomposition.construct_tensor(), dense_decomposition.construct_tensor())
@@ -1,6 +1,7 @@
 import pytest
 from tenkit.decomposition import decompositions
 import tempfile
+import h5py
 import numpy as np
 
 
@@ -112,6 +113,67 @@ class TestKruskalTensor:
             assert random_3mode_ktensor.weights[component] == single_component_decomposition.weights[0]
             assert single_component_decomposition.rank == 1
 
+    def test_implicit_arithmetic_equals_dense_arithmetic(self, random_3mode_ktensor):
+        other = decompositions.KruskalTensor(
+            [np.random.randn(30, 2), np.random.randn(40, 2), np.random.randn(50, 2)], weights=[2, 3]
+        )
+        X = random_3mode_ktensor.construct_tensor()
+        Y = other.construct_tensor()
+
+        assert np.isclose(random_3mode_ktensor.inner_product(other), np.sum(X*Y))
+        assert np.isclose(random_3mode_ktensor.norm(), np.linalg.norm(X))
+        assert np.isclose(random_3mode_ktensor.distance(other), np.linalg.norm(X - Y))
+
+        summed = random_3mode_ktensor + other
+        assert summed.rank == 6
+        assert np.allclose(summed.construct_tensor(), X + Y)
+
+    def test_distance_to_nearly_equal_tensor(self, random_3mode_ktensor):
+        perturbed = decompositions.KruskalTensor(
+            [factor_matrix + 1e-8*np.random.randn(*factor_matrix.shape) for factor_matrix in random_3mode_ktensor],
+            random_3mode_ktensor.weights + 1e-8,
+        )
+        X = random_3mode_ktensor.construct_tensor()
+        Y = perturbed.construct_tensor()
+
+        distance = random_3mode_ktensor.distance(perturbed)
+        assert np.isfinite(distance)
+        assert np.isclose(distance, np.linalg.norm(X - Y), rtol=1e-5, atol=0)
+        assert random_3mode_ktensor.distance(random_3mode_ktensor) == 0
+
+    def test_construct_entries_equals_constructed_tensor(self, random_3mode_ktensor):
+        tensor = random_3mode_ktensor.construct_tensor()
+        indices = np.stack([np.random.randint(0, size, size=100) for size in (30, 40, 50)], axis=1)
+        assert np.allclose(random_3mode_ktensor.construct_entries(indices), tensor[tuple(indices.T)])
+
+    @pytest.mark.parametrize(
+        "index", [(1, 2, 3), (slice(None), 2, 3), (1, slice(None), 3), (1, 2), 3, (slice(2, 10), slice(None, None, 2))]
+    )
+    def test_construct_subtensor_equals_constructed_tensor(self, random_3mode_ktensor, index):
+        tensor = random_3mode_ktensor.construct_tensor()
+        assert np.allclose(random_3mode_ktensor.construct_subtensor(index), tensor[index])
+
+    @pytest.mark.parametrize("chunk_mode", [0, 1, 2])
+    @pytest.mark.parametrize("memory_budget", [None, 1000, 100_000])
+    def test_chunked_construction_into_memmap(self, tmp_path, random_3mode_ktensor, chunk_mode, memory_budget):
+        out = np.lib.format.open_memmap(tmp_path/'X.npy', mode='w+', shape=(30, 40, 50))
+        constructed = random_3mode_ktensor.construct_tensor(out=out, chunk_mode=chunk_mode, memory_budget=memory_budget)
+        assert constructed is out
+        assert np.allclose(out, random_3mode_ktensor.construct_tensor())
+
+    def test_chunked_construction_into_hdf5_dataset(self, tmp_path, random_3mode_ktensor):
+        with h5py.File(tmp_path/'X.h5', 'w') as h5:
+            out = h5.create_dataset('X', shape=(30, 40, 50))
+            random_3mode_ktensor.construct_tensor(out=out, memory_budget=10_000)
+            assert np.allclose(out[...], random_3mode_ktensor.construct_tensor())
+
+    def test_arithmetic_requires_same_shape(self, random_3mode_ktensor):
+        other = decompositions.KruskalTensor.random_init((30, 40, 51), rank=2)
+        with pytest.raises(ValueError):
+            random_3mode_ktensor.inner_product(other)
+        with pytest.raises(ValueError):
+            random_3mode_ktensor + other
+
     
 
 class TestEvolvingTensor:
@@ -209,6 +271,78 @@ class TestEvolvingTensor:
         for k, slice_ in enumerate(nonuniform_evolving_tensor.construct_slices()):
             assert np.allclose(tensor[:, :slice_.shape[1], k], slice_)
 
+    def test_construct_entries_equals_constructed_tensor(self, nonuniform_evolving_tensor):
+        tensor = nonuniform_evolving_tensor.construct_tensor()
+        k = np.random.randint(0, 50, size=100)
+        j = np.array([np.random.randint(0, nonuniform_evolving_tensor.slice_shapes[k_][1]) for k_ in k])
+        i = np.random.randint(0, 30, size=100)
+        indices = np.stack([i, j, k], axis=1)
+
+        assert np.allclose(nonuniform_evolving_tensor.construct_entries(indices), tensor[i, j, k])
+
+    def test_construct_entries_with_negative_indices(self, nonuniform_evolving_tensor):
+        tensor = nonuniform_evolving_tensor.construct_tensor()
+        indices = np.array([[3, -1, -1], [4, -2, 0], [-5, 1, -1], [0, -30, 7]])
+        assert np.allclose(nonuniform_evolving_tensor.construct_entries(indices), tensor[tuple(indices.T)])
+
+    def test_construct_entries_in_zero_padding(self, nonuniform_evolving_tensor):
+        I, J, K = nonuniform_evolving_tensor.shape
+        slice_lengths = [shape[1] for shape in nonuniform_evolving_tensor.slice_shapes]
+        k = int(np.argmin(slice_lengths))
+        tensor = nonuniform_evolving_tensor.construct_tensor()
+
+        indices = np.array([[0, slice_lengths[k], k], [1, J - 1, k], [2, 0, k]])
+        entries = nonuniform_evolving_tensor.construct_entries(indices)
+        assert np.allclose(entries, tensor[tuple(indices.T)])
+        assert np.all(entries[:2] == 0)
+
+        with pytest.raises(IndexError):
+            nonuniform_evolving_tensor.construct_entries([[0, J, 0]])
+        with pytest.raises(IndexError):
+            nonuniform_evolving_tensor.construct_entries([[0, 0, K]])
+
+    @pytest.mark.parametrize(
+        "index", [(1, 2, 3), (slice(None), 2, 3), (1, slice(None), 3), (1, 2), 3, (slice(2, 10), slice(None, None, 2))]
+    )
+    def test_construct_subtensor_equals_constructed_tensor(self, nonuniform_evolving_tensor, index):
+        tensor = nonuniform_evolving_tensor.construct_tensor()
+        assert np.allclose(nonuniform_evolving_tensor.construct_subtensor(index), tensor[index])
+
+    @pytest.mark.parametrize("memory_budget", [None, 1000, 100_000])
+    def test_chunked_construction_into_memmap(self, tmp_path, nonuniform_evolving_tensor, memory_budget):
+        out = np.lib.format.open_memmap(tmp_path/'X.npy', mode='w+', shape=tuple(nonuniform_evolving_tensor.shape))
+        out[...] = np.nan
+        nonuniform_evolving_tensor.construct_tensor(out=out, memory_budget=memory_budget)
+        assert np.allclose(out, nonuniform_evolving_tensor.construct_tensor())
+
+    def test_chunked_construction_with_budget_smaller_than_a_slice(self, nonuniform_evolving_tensor):
+        class RecordingArray:
+            def __init__(self, array):
+                self.array = array
+                self.shape = array.shape
+                self.written_nbytes = []
+
+            def __setitem__(self, index, value):
+                self.written_nbytes.append(np.asarray(value).nbytes)
+                self.array[index] = value
+
+        I, J, K = nonuniform_evolving_tensor.shape
+        memory_budget = 4*3*8*J
+        out = RecordingArray(np.full((I, J, K), np.nan))
+        nonuniform_evolving_tensor.construct_tensor(out=out, memory_budget=memory_budget)
+
+        assert max(out.written_nbytes) <= memory_budget
+        assert len(out.written_nbytes) > K
+        assert np.allclose(out.array, nonuniform_evolving_tensor.construct_tensor())
+
+    def test_chunked_uniform_construction(self, uniform_evolving_tensor):
+        tensor = uniform_evolving_tensor.construct_tensor()
+        assert np.allclose(uniform_evolving_tensor.construct_tensor(memory_budget=10_000), tensor)
+
+    def test_batched_slices_equal_single_slices(self, nonuniform_evolving_tensor):
+        for k, slice_ in enumerate(nonuniform_evolving_tensor.construct_slices()):
+            assert np.allclose(slice_, nonuniform_evolving_tensor.construct_slice(k))
+
     def test_nonuniform_tensor_is_padded_with_zeros(self, nonuniform_evolving_tensor):
         tensor = nonuniform_evolving_tensor.construct_tensor()
         for k, slice_ in enumerate(nonuniform_evolving_tensor.construct_slices()):
@@ -278,3 +412,63 @@ class TestParafac2Tensor(TestEvolvingTensor):
 
         for Pk, lPk in zip(nonuniform_evolving_tensor.projection_matrices, loaded_tensor.projection_matrices):
             np.allclose(Pk, lPk)
+
+    def test_evolving_factors_are_cached(self, nonuniform_evolving_tensor):
+        B = nonuniform_evolving_tensor.B
+        assert np.shares_memory(B[3], B.unfolded())
+        assert np.allclose(B.unfolded(), np.concatenate([
+            P_k@nonuniform_evolving_tensor.blueprint_B for P_k in nonuniform_evolving_tensor.projection_matrices
+        ]))
+        with pytest.raises(ValueError):
+            B[3][...] = 0
+
+    def test_evolving_factor_cache_is_cleared(self, nonuniform_evolving_tensor):
+        B = nonuniform_evolving_tensor.B
+        old_B3 = B[3].copy()
+        nonuniform_evolving_tensor.blueprint_B[...] *= 2
+        assert np.allclose(B[3], old_B3)
+
+        B.clear_cache()
+        assert np.allclose(B[3], 2*old_B3)
+
+    def test_bounded_evolving_factor_cache(self, nonuniform_evolving_tensor):
+        B = decompositions.ProjectedFactor(
+            nonuniform_evolving_tensor.blueprint_B, nonuniform_evolving_tensor.projection_matrices, cache_size=2
+        )
+        for k in range(len(B)):
+            assert np.allclose(B[k], nonuniform_evolving_tensor.B[k])
+        assert list(B._lru_cache) == [len(B) - 2, len(B) - 1]
+
+        B[len(B) - 2]
+        B[0]
+        assert list(B._lru_cache) == [len(B) - 2, 0]
+
+    @pytest.mark.parametrize('cache_size', [None, 0, 2])
+    def test_unfolded_chunk_of_evolving_factors(self, nonuniform_evolving_tensor, cache_size):
+        B = decompositions.ProjectedFactor(
+            nonuniform_evolving_tensor.blueprint_B, nonuniform_evolving_tensor.projection_matrices, cache_size=cache_size
+        )
+        assert np.allclose(B.unfolded(), nonuniform_evolving_tensor.B_unfolded)
+        assert np.allclose(B.unfolded(3, 7), np.concatenate([nonuniform_evolving_tensor.B[k] for k in range(3, 7)]))
+
+    @pytest.mark.parametrize('cache_size', [None, 2])
+    def test_setting_factors_clears_evolving_factor_cache(self, nonuniform_evolving_tensor, cache_size):
+        pf2tensor = decompositions.Parafac2Tensor(
+            nonuniform_evolving_tensor.A,
+            nonuniform_evolving_tensor.blueprint_B,
+            nonuniform_evolving_tensor.C,
+            nonuniform_evolving_tensor.projection_matrices,
+            warning=False,
+            cache_size=cache_size,
+        )
+        old_B3 = pf2tensor.B[3].copy()
+        pf2tensor.B.unfolded()
+
+        pf2tensor.blueprint_B = 2*pf2tensor.blueprint_B
+        assert np.allclose(pf2tensor.B[3], 2*old_B3)
+        assert np.allclose(pf2tensor.B.unfolded(3, 4), 2*old_B3)
+
+        projection_matrices = [-P_k for P_k in pf2tensor.projection_matrices]
+        pf2tensor.projection_matrices = projection_matrices
+        assert np.allclose(pf2tensor.B[3], -2*old_B3)
+        assert np.allclose(pf2tensor.B.unfolded(3, 4), -2*old_B3)
@@ -1,3 +1,4 @@
+import copy
 import tempfile
 import itertools
 from pathlib import Path
@@ -9,8 +10,10 @@ import h5py
 from .test_utils import ensure_monotonicity
 from tenkit.decomposition import parafac2
 from tenkit.decomposition import decompositions
+from tenkit.decomposition import logging
 from tenkit import base
 from tenkit import metrics
+from tenkit.ragged import RaggedArray, LazyRaggedArray
 # Husk: Test at weights og factors endres inplace
 # TODO: test factor match score
 
@@ -136,4 +139,248 @@ class TestParafac2ALS:
             assert np.allclose(parafac2_decomposer.decomposition.blueprint_B, parafac2_decomposer2.decomposition.blueprint_B)
                 
             for P1, P2 in zip(parafac2_decomposer.decomposition.projection_matrices, parafac2_decomposer2.decomposition.projection_matrices):
-                assert np.allclose(P1, P2)
\ No newline at end of file
+                assert np.allclose(P1, P2)
+
+    def test_projected_X_is_updated_in_place(self, rank4_parafac2_tensor):
+        X = rank4_parafac2_tensor.construct_tensor()
+        parafac2_als = parafac2.Parafac2_ALS(4, max_its=5, print_frequency=-1)
+        parafac2_als.fit(X)
+        
+        projected_X = parafac2_als.projected_X
+        for k, P_k in enumerate(parafac2_als.decomposition.projection_matrices):
+            assert np.allclose(projected_X[..., k], X[..., k]@P_k)
+        assert np.allclose(parafac2_als.projected_X_norm, np.linalg.norm(projected_X))
+
+        assert parafac2_als.projected_X is projected_X
+        assert parafac2_als.cp_decomposer.X is projected_X
+        assert np.allclose(parafac2_als.cp_decomposer.X_norm, np.linalg.norm(projected_X))
+
+    def test_two_slice_passes_per_iteration(self, rank4_parafac2_tensor):
+        X = rank4_parafac2_tensor.construct_tensor()
+
+        num_passes = []
+        for max_its in [3, 6]:
+            parafac2_als = parafac2.Parafac2_ALS(4, max_its=max_its, convergence_tol=0, print_frequency=-1)
+            passes = []
+            for_each_slice_chunk = parafac2_als._for_each_slice_chunk
+            def counting_for_each_slice_chunk(function, X=None):
+                passes.append(function)
+                return for_each_slice_chunk(function, X=X)
+            parafac2_als._for_each_slice_chunk = counting_for_each_slice_chunk
+
+            parafac2_als.fit(X)
+            assert parafac2_als.current_iteration == max_its
+            num_passes.append(len(passes))
+
+        # One pass updates the projection matrices and one pass projects the slices,
+        # the loss is computed from the projected tensor
+        assert num_passes[1] - num_passes[0] == 2*3
+
+    def test_threaded_projection_equals_serial_projection(self, rank4_parafac2_tensor):
+        X = rank4_parafac2_tensor.construct_tensor()
+        parafac2_als = parafac2.Parafac2_ALS(4, max_its=5, print_frequency=-1)
+        parafac2_als.fit(X)
+        serial_projected_X = parafac2_als.projected_X.copy()
+
+        parafac2_als.n_threads = 4
+        assert np.allclose(parafac2_als.projected_X, serial_projected_X)
+
+    def test_compressed_slices_gives_same_decomposition(self):
+        pf2tensor = decompositions.Parafac2Tensor.random_init((10, [60]*20, 20), rank=3)
+        X = pf2tensor.construct_slices()
+        initial_decomposition = decompositions.Parafac2Tensor.random_init((10, [60]*20, 20), rank=3)
+
+        decompositions_ = []
+        for compress_slices in [False, True]:
+            parafac2_als = parafac2.Parafac2_ALS(
+                3, max_its=50, convergence_tol=1e-20, init='precomputed', print_frequency=-1,
+                compress_slices=compress_slices
+            )
+            parafac2_als.fit(X, initial_decomposition=copy.deepcopy(initial_decomposition))
+            decompositions_.append(parafac2_als.decomposition)
+
+        decomposition, compressed_decomposition = decompositions_
+        assert np.allclose(decomposition.A, compressed_decomposition.A)
+        assert np.allclose(decomposition.C, compressed_decomposition.C)
+        for P1, P2 in zip(decomposition.projection_matrices, compressed_decomposition.projection_matrices):
+            assert P2.shape == (60, 3)
+            assert np.allclose(P1@decomposition.blueprint_B, P2@compressed_decomposition.blueprint_B)
+
+    def test_compressed_slices_gives_same_MSE(self):
+        pf2tensor = decompositions.Parafac2Tensor.random_init((10, [60]*20, 20), rank=3)
+        X = pf2tensor.construct_slices()
+        X = [X_k + 0.1*np.random.standard_normal(X_k.shape) for X_k in X]
+        initial_decomposition = decompositions.Parafac2Tensor.random_init((10, [60]*20, 20), rank=3)
+
+        MSE_logs = []
+        for compress_slices in [False, True]:
+            MSE_logger = logging.MSELogger()
+            parafac2_als = parafac2.Parafac2_ALS(
+                3, max_its=10, convergence_tol=1e-20, init='precomputed', print_frequency=-1,
+                compress_slices=compress_slices, loggers=[MSE_logger]
+            )
+            parafac2_als.fit(X, initial_decomposition=copy.deepcopy(initial_decomposition))
+            MSE_logs.append(MSE_logger.log_metrics)
+
+        assert len(MSE_logs[0]) == len(MSE_logs[1]) > 0
+        assert np.allclose(MSE_logs[0], MSE_logs[1])
+
+    def test_irregular_decomposition(self):
+        J_ks = [np.random.randint(10, 20) for _ in range(15)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((12, J_ks, 15), rank=3)
+        X = pf2tensor.construct_slices()
+
+        parafac2_als = parafac2.Parafac2_ALS(3, max_its=1000, convergence_tol=1e-10, print_frequency=-1)
+        estimated_pf2tensor = parafac2_als.fit_transform(X)
+
+        assert isinstance(parafac2_als.X, RaggedArray)
+        assert np.allclose(parafac2_als.SSE, sum(
+            np.linalg.norm(X_k - estimated_X_k)**2 for X_k, estimated_X_k in zip(X, estimated_pf2tensor.construct_slices())
+        ))
+        assert parafac2_als.SSE/parafac2_als.X_norm**2 < 1e-5
+
+    @pytest.mark.parametrize('n_threads', [1, 3])
+    def test_irregular_svd_init(self, n_threads):
+        J_ks = [np.random.randint(10, 20) for _ in range(15)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((12, J_ks, 15), rank=3)
+        X = pf2tensor.construct_slices()
+
+        parafac2_als = parafac2.Parafac2_ALS(3, max_its=0, init='svd', print_frequency=-1, n_threads=n_threads)
+        parafac2_als.fit(X)
+        assert np.allclose(parafac2_als._slice_cross_product(), sum(X_k@X_k.T for X_k in X))
+
+        # The initial A spans the column space of the data
+        A = parafac2_als.decomposition.A
+        assert A.shape == (12, 3)
+        assert np.allclose(A@np.linalg.lstsq(A, pf2tensor.A, rcond=None)[0], pf2tensor.A)
+
+    @pytest.mark.parametrize('compress_slices', [False, True])
+    def test_partial_fit_extends_decomposition(self, compress_slices):
+        J_ks = [np.random.randint(15, 25) for _ in range(40)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((20, J_ks, 40), rank=3)
+        X = pf2tensor.construct_slices()
+
+        parafac2_als = parafac2.Parafac2_ALS(
+            3, max_its=200, convergence_tol=1e-10, print_frequency=-1, compress_slices=compress_slices
+        )
+        parafac2_als.fit(X[:30])
+        decomposition = parafac2_als.decomposition
+
+        parafac2_als.partial_fit(X[30:])
+        assert parafac2_als.decomposition is decomposition
+        assert decomposition.C.shape == (40, 3)
+        assert len(decomposition.projection_matrices) == 40
+        assert np.allclose(parafac2_als.X_norm, np.linalg.norm(np.concatenate(X, axis=1)))
+        assert parafac2_als.explained_variance > 0.99
+
+        # The loss is computed from the cached projected slices, which should give the exact loss
+        SSE = sum(
+            np.linalg.norm(X_k - estimated_X_k)**2 for X_k, estimated_X_k in zip(X, decomposition.construct_slices())
+        )
+        assert np.allclose(parafac2_als.loss, SSE)
+
+    def test_batched_projection_update_equals_slicewise_update(self, rank4_parafac2_tensor):
+        X = rank4_parafac2_tensor.construct_tensor()
+        parafac2_als = parafac2.Parafac2_ALS(4, max_its=5, print_frequency=-1)
+        parafac2_als.fit(X)
+        A = parafac2_als.decomposition.A
+        blueprint_B = parafac2_als.decomposition.blueprint_B
+        C = parafac2_als.decomposition.C
+
+        parafac2_als._update_projection_matrices()
+        for k, P_k in enumerate(parafac2_als.decomposition.projection_matrices):
+            assert np.allclose(P_k, base.orthogonal_solve((C[k]*A)@blueprint_B.T, X[..., k]).T)
+
+    def test_threaded_slice_updates_equal_serial_updates(self):
+        J_ks = [np.random.randint(10, 20) for _ in range(15)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((12, J_ks, 15), rank=3)
+        X = pf2tensor.construct_slices()
+        parafac2_als = parafac2.Parafac2_ALS(3, max_its=5, print_frequency=-1)
+        parafac2_als.fit(X)
+
+        parafac2_als._update_projection_matrices()
+        serial_projection_matrices = [P_k.copy() for P_k in parafac2_als.decomposition.projection_matrices]
+        serial_projected_X = parafac2_als.projected_X.copy()
+        serial_SSE = parafac2_als.SSE
+
+        parafac2_als.n_threads = 3
+        parafac2_als._update_projection_matrices()
+        for P_k, serial_P_k in zip(parafac2_als.decomposition.projection_matrices, serial_projection_matrices):
+            assert np.allclose(P_k, serial_P_k)
+        assert np.allclose(parafac2_als.projected_X, serial_projected_X)
+        assert np.allclose(parafac2_als.SSE, serial_SSE)
+
+    @pytest.mark.parametrize('compress_slices', [False, True])
+    def test_out_of_core_decomposition_equals_in_memory_decomposition(self, compress_slices):
+        J_ks = [np.random.randint(10, 20) for _ in range(15)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((12, J_ks, 15), rank=3)
+        X = pf2tensor.construct_slices()
+        initial_decomposition = decompositions.Parafac2Tensor.random_init((12, J_ks, 15), rank=3)
+
+        parafac2_als = parafac2.Parafac2_ALS(
+            3, max_its=20, convergence_tol=1e-20, init='precomputed', print_frequency=-1,
+            compress_slices=compress_slices
+        )
+        parafac2_als.fit(X, initial_decomposition=copy.deepcopy(initial_decomposition))
+        decomposition = parafac2_als.decomposition
+
+        with tempfile.TemporaryDirectory() as tempfolder:
+            with h5py.File(f'{tempfolder}/slices.h5', 'w') as h5:
+                for k, X_k in enumerate(X):
+                    h5[str(k)] = X_k
+                
+                lazy_parafac2_als = parafac2.Parafac2_ALS(
+                    3, max_its=20, convergence_tol=1e-20, init='precomputed', print_frequency=-1,
+                    compress_slices=compress_slices
+                )
+                # Force several chunks
+                lazy_parafac2_als._max_lazy_chunk_size = 200
+                lazy_parafac2_als.fit(h5, initial_decomposition=copy.deepcopy(initial_decomposition))
+                lazy_decomposition = lazy_parafac2_als.decomposition
+
+                assert isinstance(lazy_parafac2_als.X, LazyRaggedArray)
+                assert np.allclose(lazy_parafac2_als.loss, parafac2_als.loss)
+
+        assert np.allclose(decomposition.A, lazy_decomposition.A)
+        assert np.allclose(decomposition.C, lazy_decomposition.C)
+        for B_k, lazy_B_k in zip(decomposition.B, lazy_decomposition.B):
+            assert np.allclose(B_k, lazy_B_k)
+
+
+class TestParafac2SALS:
+    @pytest.fixture
+    def irregular_slices(self):
+        J_ks = [np.random.randint(15, 25) for _ in range(200)]
+        pf2tensor = decompositions.Parafac2Tensor.random_init((20, J_ks, 200), rank=3)
+        return pf2tensor.construct_slices()
+
+    def test_rank3_decomposition(self, irregular_slices):
+        parafac2_sals = parafac2.Parafac2_SALS(
+            3, max_its=300, convergence_tol=1e-10, batch_size=50, print_frequency=-1
+        )
+        parafac2_sals.fit(irregular_slices)
+
+        assert len(parafac2_sals._held_out_indices) == 20
+        assert parafac2_sals.loss < parafac2_sals.X_norm**2
+        assert parafac2_sals.explained_variance > 0.99
+
+    def test_held_out_slices_are_not_sampled(self, irregular_slices):
+        parafac2_sals = parafac2.Parafac2_SALS(3, max_its=1, batch_size=50, print_frequency=-1)
+        parafac2_sals.fit(irregular_slices)
+
+        for _ in range(10):
+            indices, X = parafac2_sals._sample_batch()
+            assert len(indices) == 50
+            assert not np.any(np.isin(indices, parafac2_sals._held_out_indices))
+            for k, X_k in zip(indices, X):
+                assert np.array_equal(X_k, irregular_slices[k])
+
+    def test_projected_X_after_fit(self, irregular_slices):
+        parafac2_sals = parafac2.Parafac2_SALS(3, max_its=5, batch_size=50, print_frequency=-1)
+        parafac2_sals.fit(irregular_slices)
+
+        projected_X = parafac2_sals.projected_X
+        assert projected_X.shape == (20, 3, 200)
+        for k, (X_k, P_k) in enumerate(zip(irregular_slices, parafac2_sals.decomposition.projection_matrices)):
+            assert np.allclose(projected_X[..., k], X_k@P_k)
+        assert np.allclose(parafac2_sals.projected_X_norm, np.linalg.norm(projected_X))
@@ -1,8 +1,10 @@
 #TODO: Let us tidu up this a bit
 import numpy as np
 import itertools
+import math
 from . import base
 import scipy
+import scipy.optimize
 from . import utils
 
 
@@ -48,66 +50,136 @@ def _factor_match_score(true_factors, estimated_factors, weight_penalty=True, no
         scores.append(score)
     return scores
 
-def factor_match_score(
-    true_factors, estimated_factors, weight_penalty=True, fms_reduction="min"
-):
-    if fms_reduction == "min":
-        fms_reduction = np.min
-    elif fms_reduction == "mean":
-        fms_reduction = np.mean
-    else:
-        raise ValueError('`fms_reduction` must be either "min" or "mean".')
+# Number of permutations for which the best matching is found by exhaustive search
+# when the components are matched to maximise the minimum score. 
+_MAX_EXHAUSTIVE_PERMUTATIONS = 5040
+
+
+def _fms_matrix(true_factors, estimated_factors, weight_penalty=True, nonnegative=True):
+    """Compute the factor match score between all pairs of true and estimated components.
+
+    The (r, s)-th element is the score obtained by matching the r-th true component
+    with the s-th estimated component. The congruence matrix of each mode is
+    computed once, so there is no need to evaluate the score for each permutation.
+    """
+    if len(true_factors[0].shape) == 1:
+        true_factors = [factor.reshape(-1,1) for factor in true_factors]
+    if len(estimated_factors[0].shape) == 1:
+        estimated_factors =  [factor.reshape(-1,1) for factor in estimated_factors] 
 
     rank = true_factors[0].shape[1]
     estimated_rank = estimated_factors[0].shape[1]
 
-    max_fms = -1
-    best_permutation = None
+    true_factors, true_norms = utils.normalize_factors(true_factors)
+    estimated_factors, estimated_norms = utils.normalize_factors(estimated_factors)
 
-    for permutation in itertools.permutations(range(estimated_rank), r=rank):
-        permuted_factors = utils.permute_factors(permutation, estimated_factors)
+    scores = np.ones((rank, estimated_rank))
+    if weight_penalty:
+        true_weights = np.prod(np.concatenate(true_norms), axis=0)[:, np.newaxis]
+        estimated_weights = np.prod(np.concatenate(estimated_norms), axis=0)[np.newaxis]
+        scores -= np.abs(true_weights - estimated_weights)/np.maximum(true_weights, estimated_weights)
 
-        fms = fms_reduction(
-            _factor_match_score(
-                true_factors, permuted_factors, weight_penalty=weight_penalty
-            )
-        )
+    for true_factor, estimated_factor in zip(true_factors, estimated_factors):
+        congruence = true_factor.T@estimated_factor
+        if nonnegative:
+            congruence = np.abs(congruence)
+        scores *= congruence
+    return scores
 
-        if fms > max_fms:
-            max_fms = fms
-            best_permutation = permutation
-    return max_fms, best_permutation
 
-def separate_mode_factor_match_score(true_factors, estimated_factors, fms_reduction='min'):
-    if fms_reduction == "min":
-        fms_reduction = np.min
-    elif fms_reduction == "mean":
-        fms_reduction = np.mean
-    else:
+def _has_perfect_matching(allowed):
+    """Check if all rows of the boolean matrix can be matched to different columns.
+    """
+    rows, columns = scipy.optimize.linear_sum_assignment(allowed, maximize=True)
+    return np.all(allowed[rows, columns])
+
+
+def _bottleneck_assignment(scores):
+    """Find the matching of rows to columns that maximises the smallest matched score.
+
+    The largest attainable minimum score is found by bisection over the unique scores, 
+    checking if there is a perfect matching using only the scores above the threshold. 
+    Ties are broken by maximising the sum of the matched scores.
+    """
+    rank = scores.shape[0]
+    thresholds = np.unique(scores)
+    low, high = 0, len(thresholds) - 1
+    while low < high:
+        middle = (low + high + 1)//2
+        if _has_perfect_matching(scores >= thresholds[middle]):
+            low = middle
+        else:
+            high = middle - 1
+    
+    # Any matching that uses a forbidden score has a smaller sum than all allowed matchings
+    masked_scores = np.where(scores >= thresholds[low], scores, -2*rank - 1)
+    _, columns = scipy.optimize.linear_sum_assignment(masked_scores, maximize=True)
+    return columns
+
+
+def _best_matching(scores, fms_reduction, allow_exhaustive_search=True):
+    """Find the permutation of the estimated components that gives the highest factor match score.
+
+    Arguments:
+    ----------
+    scores: np.ndarray
+        Matrix of factor match scores between each pair of components, as given
+        by ``_fms_matrix``.
+    fms_reduction: str
+        Either "min" or "mean".
+    allow_exhaustive_search: bool
+        If False, then the bottleneck assignment is used for the "min" reduction 
+        regardless of the rank. The score is the same, but ties may be broken differently.
+    """
+    if fms_reduction not in {"min", "mean"}:
         raise ValueError('`fms_reduction` must be either "min" or "mean".')
 
-    rank = true_factors[0].shape[1]
-    estimated_rank = estimated_factors[0].shape[1]
+    rank, estimated_rank = scores.shape
+    if rank > estimated_rank:
+        return -1, None
+
+    rows = np.arange(rank)
+    if fms_reduction == "mean":
+        _, permutation = scipy.optimize.linear_sum_assignment(scores, maximize=True)
+        return np.mean(scores[rows, permutation]), tuple(permutation.tolist())
+
+    if allow_exhaustive_search and math.perm(estimated_rank, rank) <= _MAX_EXHAUSTIVE_PERMUTATIONS:
+        # Exhaustive search keeps the tie-breaking of earlier versions for small ranks
+        permutation = max(
+            itertools.permutations(range(estimated_rank), r=rank),
+            key=lambda permutation: np.min(scores[rows, permutation])
+        )
+    else:
+        permutation = tuple(_bottleneck_assignment(scores).tolist())
+    return np.min(scores[rows, permutation]), permutation
 
 
+def factor_match_score(
+    true_factors, estimated_factors, weight_penalty=True, fms_reduction="min"
+):
+    """Compute the factor match score (FMS) of the best matching of the estimated components.
+
+    The congruence between all pairs of components are computed once for each mode, 
+    and the best matching is found with a linear sum assignment solver.
+
+    Returns:
+    --------
+    float:
+        The factor match score.
+    tuple(int):
+        The estimated components that best match the true components, so that the
+        i-th true component is matched with the ``permutation[i]``-th estimated component.
+    """
+    scores = _fms_matrix(true_factors, estimated_factors, weight_penalty=weight_penalty)
+    return _best_matching(scores, fms_reduction)
+
+def separate_mode_factor_match_score(true_factors, estimated_factors, fms_reduction='min'):
     max_fms = []
     best_permutation = []
 
     for true_factor, estimated_factor in zip(true_factors, estimated_factors):
-        current_max_fms = -1
-        current_best_permutation = None
-        for permutation in itertools.permutations(range(estimated_rank), r=rank):
-            permuted_factor = utils.permute_factors(permutation, [estimated_factor])
-
-            fms = fms_reduction(
-                _factor_match_score(
-                    [true_factor], permuted_factor, weight_penalty=False
-                )
-            )
-
-            if fms > current_max_fms:
-                current_max_fms = fms
-                current_best_permutation = permutation
+        scores = _fms_matrix([true_factor], [estimated_factor], weight_penalty=False)
+        current_max_fms, current_best_permutation = _best_matching(scores, fms_reduction)
         
         max_fms.append(current_max_fms)
         best_permutation.append(current_best_permutation)
@@ -115,49 +187,151 @@ def separate_mode_factor_match_score(true_factors, estimated_factors, fms_reduct
 
 
 
-def tensor_completion_score(X, X_hat, W):
-    return np.linalg.norm((1 - W) * (X - X_hat)) / np.linalg.norm((1 - W) * X)
+def pairwise_factor_match_score(models, weight_penalty=True, fms_reduction='min'):
+    """Compute the factor match score between all pairs of models with the same rank.
+
+    Useful for stability analysis of multiple initialisations or bootstrap samples.
+    The factor matrices of each model are normalised once and stacked, so the 
+    congruence matrices between one model and all others are computed with a 
+    batched matrix product for each mode.
+
+    Arguments:
+    ----------
+    models: list(list(np.ndarray))
+        The factor matrices of each model, e.g. ``[ktensor.factor_matrices for ktensor in ktensors]``.
+    weight_penalty: bool (optional, default=True)
+        Whether the component norms should be penalised.
+    fms_reduction: str (optional, default='min')
+        Either "min" or "mean".
+
+    Returns:
+    --------
+    np.ndarray:
+        Symmetric matrix with the factor match score of all pairs of models.
+    np.ndarray(dtype=int):
+        Array of shape (num_models, num_models, rank), where the ``permutations[i, j]``
+        is the components of model ``j`` that best match the components of model ``i``.
+    """
+    if fms_reduction not in {"min", "mean"}:
+        raise ValueError('`fms_reduction` must be either "min" or "mean".')
 
+    num_models = len(models)
+    rank = models[0][0].shape[1]
+    if any(factor.shape[1] != rank for factors in models for factor in factors):
+        raise ValueError('All models must have the same rank.')
+
+    normalized_models, models_norms = zip(*(utils.normalize_factors(factors) for factors in models))
+    stacked_factors = [np.stack(mode_factors) for mode_factors in zip(*normalized_models)]
+    weights = np.stack([np.prod(np.concatenate(norms), axis=0) for norms in models_norms])
+
+    fms = np.ones((num_models, num_models))
+    permutations = np.empty((num_models, num_models, rank), dtype=int)
+    permutations[np.arange(num_models), np.arange(num_models)] = np.arange(rank)
+    for i in range(num_models - 1):
+        # scores[j - i - 1] is the matrix of component match scores between model i and model j > i
+        scores = np.ones((num_models - i - 1, rank, rank))
+        if weight_penalty:
+            model_weights = weights[i][:, np.newaxis]
+            other_weights = weights[i+1:, np.newaxis]
+            scores -= np.abs(model_weights - other_weights)/np.maximum(model_weights, other_weights)
+        for factors in stacked_factors:
+            scores *= np.abs(np.matmul(factors[i].T, factors[i+1:]))
+
+        for j, pair_scores in enumerate(scores, start=i+1):
+            pair_fms, permutation = _best_matching(pair_scores, fms_reduction, allow_exhaustive_search=False)
+            fms[i, j] = fms[j, i] = pair_fms
+            permutations[i, j] = permutation
+            permutations[j, i] = np.argsort(permutation)
+    return fms, permutations
+
+
+def cluster_solutions(fms, threshold=0.95, losses=None):
+    """Group models that are equal up to a permutation into unique solutions.
+
+    The models are visited in order of increasing loss (or in the given order if
+    ``losses`` is None). Each model that is not yet assigned to a solution becomes 
+    the representative of a new solution, which all unassigned models with a factor 
+    match score of at least ``threshold`` to the representative are assigned to.
+
+    Arguments:
+    ----------
+    fms: np.ndarray
+        Matrix of pairwise factor match scores, as given by ``pairwise_factor_match_score``.
+    threshold: float (optional, default=0.95)
+        Smallest factor match score for two models to be considered equal.
+    losses: np.ndarray (optional, default=None)
+        Final loss of each model, so that the best model is the representative of each solution.
+
+    Returns:
+    --------
+    np.ndarray(dtype=int):
+        The solution label of each model.
+    list(int):
+        The index of the representative model of each solution.
+    """
+    num_models = fms.shape[0]
+    order = np.arange(num_models) if losses is None else np.argsort(losses, kind='stable')
+
+    labels = np.full(num_models, -1, dtype=int)
+    representatives = []
+    for model in order:
+        if labels[model] != -1:
+            continue
+        is_member = (labels == -1) & (fms[model] >= threshold)
+        is_member[model] = True
+        labels[is_member] = len(representatives)
+        representatives.append(int(model))
+    return labels, representatives
 
-def core_consistency(X, A, B, C, normalized=False):
-    # TODO: generalise to more than three modes
-    F = A.shape[1]
 
+def tensor_completion_score(X, X_hat, W):
+    return np.linalg.norm((1 - W) * (X - X_hat)) / np.linalg.norm((1 - W) * X)
 
 
+def core_consistency(X, *factor_matrices, normalized=False):
+    r"""Compute the core consistency diagnostic (CORCONDIA) of a CP model of an N-way tensor.
 
+    The least squares Tucker core with the CP factor matrices as loadings is 
+    computed with one tensor-times-matrix product per mode,
 
+    .. math::
 
+        \mathcal{G} = \mathcal{X} \times_1 A_1^\dagger \times_2 ... \times_N A_N^\dagger,
 
+    so the Kronecker product of the factor matrices is never formed.
 
-    # Create the superdiagonal tensor
-    T = np.zeros((F,F,F))
-    np.fill_diagonal(T, 1)
-    
-    # Separate the weights evenly along the three modes
-    [A, B, C], norms = utils.normalize_factors((A, B, C))
-    weights = np.prod(np.concatenate(norms), axis=0, keepdims=True)
-    A *= weights**(1/3)
-    B *= weights**(1/3)
-    C *= weights**(1/3)
+    Arguments:
+    ----------
+    X: np.ndarray
+        The data tensor.
+    *factor_matrices: np.ndarray
+        The factor matrices of the CP model, one for each mode of X.
+    normalized: bool (optional, default=False)
+        If True, then the squared error is divided by the squared norm of the core 
+        instead of by the rank.
+    """
+    rank = factor_matrices[0].shape[1]
+    num_modes = len(factor_matrices)
+    if num_modes != X.ndim:
+        raise ValueError(f'There must be one factor matrix for each mode of X ({X.ndim}), not {num_modes}.')
 
-    # Generate vectorized variables to find Tucker core    
-    k = base.kron(A.T, B.T, C.T)
-    vec_T = T.reshape((-1, 1))
-    vec_X = X.reshape((-1, 1))
+    # Separate the weights evenly along the modes
+    factor_matrices, norms = utils.normalize_factors(factor_matrices)
+    weights = np.prod(np.concatenate(norms), axis=0, keepdims=True)
+    factor_matrices = [factor_matrix*weights**(1/num_modes) for factor_matrix in factor_matrices]
 
-    # ALS-step to find Tucker core
-    Q, R = np.linalg.qr(k.T)
-    _rhs = Q.T @ vec_X
-    vec_G = scipy.linalg.solve_triangular(R, _rhs)
+    # Multiply along the longest modes first, since they shrink the tensor the most
+    G = X
+    for mode in sorted(range(num_modes), key=lambda mode: X.shape[mode], reverse=True):
+        G = np.tensordot(np.linalg.pinv(factor_matrices[mode]), G, axes=(1, mode))
+        G = np.moveaxis(G, 0, mode)
 
-    # Old versions
-    # _rhs = k @ vec_X
-    # _rhs = solve_triangular(R, _rhs, trans='T')
-    #   vec_G = np.linalg.lstsq(k.T, vec_X)[0]
+    # ||G - T||^2 where T is the superdiagonal core with ones on the diagonal
+    superdiagonal = G[(np.arange(rank),)*num_modes]
+    squared_error = np.linalg.norm(G)**2 - 2*np.sum(superdiagonal) + rank
 
-    denom = np.linalg.norm(vec_G)**2 if normalized else F
-    return np.squeeze(100*(1-sum((vec_G-vec_T)**2)/denom))
+    denom = np.linalg.norm(G)**2 if normalized else rank
+    return 100*(1 - squared_error/denom)
 
 
 
@@ -189,8 +363,14 @@ def calculate_core_consistencies(X, upper_rank=5):
 
 
 def leverage(factor_matrix):
-    leverage_scores = np.diagonal(factor_matrix@np.linalg.inv((factor_matrix.T@factor_matrix)).T@factor_matrix.T)
-    return leverage_scores
+    r"""Compute the leverage score of each row of a factor matrix.
+
+    The leverage scores are the diagonal of the hat matrix, :math:`F (F^T F)^{-1} F^T`,
+    which are the squared row norms of :math:`Q` in the thin QR decomposition 
+    :math:`F = QR`. The hat matrix is therefore never formed.
+    """
+    Q = np.linalg.qr(factor_matrix, mode='reduced')[0]
+    return np.einsum('ir,ir->i', Q, Q)
 
 
 def _factor_match_score_parafac2(true_factors, estimated_factors, weight_penalty=True, nonnegative=True):
@@ -259,36 +439,101 @@ def _factor_match_score_parafac2(true_factors, estimated_factors, weight_penalty
 def factor_match_score_parafac2(
     true_factors, estimated_factors, weight_penalty=True, fms_reduction="min"
 ):
-    if fms_reduction == "min":
-        fms_reduction = np.min
-    elif fms_reduction == "mean":
-        fms_reduction = np.mean
-    else:
-        raise ValueError('́`fms_reduction` must be either "min" or "mean".')
-
-    rank = true_factors[0].shape[1]
-    estimated_rank = estimated_factors[0].shape[1]
-
-    max_fms = -1
-    best_permutation = None
+    """Compute the factor match score of the A and C factor matrices of two PARAFAC2 models.
+    """
     true_factors = [true_factors[0], true_factors[2]]
-
-    for permutation in itertools.permutations(range(estimated_rank), r=rank):
-        permuted_factors = [
-            estimated_factors[0][:, permutation],
-            estimated_factors[2][:, permutation]
-        ]
-
-        fms = fms_reduction(
-            _factor_match_score(
-                true_factors, permuted_factors, weight_penalty=weight_penalty
-            )
-        )
-
-        if fms > max_fms:
-            max_fms = fms
-            best_permutation = permutation
-    return max_fms, best_permutation
+    estimated_factors = [estimated_factors[0], estimated_factors[2]]
+    return factor_match_score(
+        true_factors, estimated_factors, weight_penalty=weight_penalty, fms_reduction=fms_reduction
+    )
+
+
+class KruskalTensorFit:
+    r"""Evaluate how well Kruskal tensors fit a data tensor without reconstructing them.
+
+    The sum of squared errors is computed as
+
+    .. math::
+
+        \|\mathcal{X} - \hat{\mathcal{X}}\|^2 = \|\mathcal{X}\|^2 
+            + \mathbf{w}^T (A_1^T A_1 * ... * A_N^T A_N) \mathbf{w} 
+            - 2 \mathbf{w}^T \text{diag}(A_1^T M_1),
+
+    where :math:`M_1` is the MTTKRP along the first mode. The squared norm of X is 
+    computed once and reused for all models that are evaluated.
+
+    Arguments:
+    ----------
+    X: np.ndarray
+        The data tensor, e.g. a memory mapped array.
+    chunk_size: int (optional, default=None)
+        Number of slices along the first mode of X that are read at a time.
+        If None, then the whole tensor is used at once.
+    """
+    def __init__(self, X, chunk_size=None):
+        self.X = X
+        self.chunk_size = chunk_size
+        self._X_sq_norm = None
+
+    def _iter_chunks(self):
+        chunk_size = self.X.shape[0] if self.chunk_size is None else self.chunk_size
+        for start in range(0, self.X.shape[0], chunk_size):
+            stop = min(start + chunk_size, self.X.shape[0])
+            yield start, stop, np.asarray(self.X[start:stop])
+
+    @property
+    def X_sq_norm(self):
+        """The squared Frobenius norm of X."""
+        if self._X_sq_norm is None:
+            self._X_sq_norm = sum(np.linalg.norm(X_chunk)**2 for _, _, X_chunk in self._iter_chunks())
+        return self._X_sq_norm
+
+    def inner_product(self, ktensor):
+        """The inner product between X and the tensor represented by ``ktensor``."""
+        first_factor_matrix = ktensor.factor_matrices[0]
+        khatri_rao_product = base.khatri_rao(*ktensor.factor_matrices[1:])
+
+        inner_products = np.zeros(ktensor.rank)
+        for start, stop, X_chunk in self._iter_chunks():
+            mttkrp = X_chunk.reshape(stop - start, -1)@khatri_rao_product
+            inner_products += np.sum(first_factor_matrix[start:stop]*mttkrp, axis=0)
+        return ktensor.weights@inner_products
+
+    def SSE(self, ktensor):
+        """The sum of squared errors between X and the tensor represented by ``ktensor``."""
+        gram_product = np.ones((ktensor.rank, ktensor.rank))
+        for factor_matrix in ktensor.factor_matrices:
+            gram_product *= factor_matrix.T@factor_matrix
+        weights = ktensor.weights
+
+        return self.X_sq_norm + weights@gram_product@weights - 2*self.inner_product(ktensor)
+
+    def evaluate(self, ktensor):
+        r"""Compute the SSE, fit and percent explained of ``ktensor``.
+
+        The fit is :math:`1 - \|\mathcal{X} - \hat{\mathcal{X}}\|/\|\mathcal{X}\|` and the percent 
+        explained is :math:`1 - \|\mathcal{X} - \hat{\mathcal{X}}\|^2/\|\mathcal{X}\|^2`, as 
+        given by ``percent_explained``.
+
+        Returns:
+        --------
+        dict:
+            Dictionary with the keys ``'SSE'``, ``'fit'`` and ``'percent_explained'``.
+        """
+        SSE = max(self.SSE(ktensor), 0)
+        return {
+            'SSE': SSE,
+            'fit': 1 - np.sqrt(SSE/self.X_sq_norm),
+            'percent_explained': 1 - SSE/self.X_sq_norm,
+        }
+
+    def fit(self, ktensor):
+        r"""The fit, :math:`1 - \|\mathcal{X} - \hat{\mathcal{X}}\|/\|\mathcal{X}\|`, of ``ktensor``."""
+        return self.evaluate(ktensor)['fit']
+
+    def percent_explained(self, ktensor):
+        r"""The percent explained, :math:`1 - \|\mathcal{X} - \hat{\mathcal{X}}\|^2/\|\mathcal{X}\|^2`, of ``ktensor``."""
+        return self.evaluate(ktensor)['percent_explained']
 
 
 def percent_explained(true_tensor, estimated_tensor):
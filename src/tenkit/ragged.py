@@ -0,0 +1,360 @@
+import numpy as np
+
+
+__all__ = ['RaggedArray', 'LazyRaggedArray']
+
+
+class RaggedArray:
+    r"""Container for a sequence of matrices that differ in length along one axis.
+
+    All matrices are stored in one contiguous buffer, ``data``, where they are
+    stacked along the ragged axis. The kth matrix is stored in the rows
+    ``data[offsets[k]:offsets[k+1]]``, and indexing the container returns a
+    view into the buffer (no copying).
+
+    If ``ragged_axis=1``, then the transposed matrices are stacked. This makes
+    it possible to store e.g. irregular PARAFAC2 slices, :math:`X_k \in \mathbb{R}^{I \times J_k}`,
+    as the :math:`(\sum_k J_k) \times I` matrix
+
+    .. math::
+
+        \begin{bmatrix} X_1 & X_2 & \cdots & X_K \end{bmatrix}^T,
+
+    and ``ragged_array[k]`` returns the :math:`I \times J_k` view ``data[offsets[k]:offsets[k+1]].T``.
+
+    Arguments:
+    ----------
+    data: np.ndarray(ndim=2)
+        Buffer containing the stacked (possibly transposed) matrices.
+    offsets: np.ndarray(ndim=1)
+        Array of length :math:`K+1` with the row offsets of each matrix in ``data``.
+        The first element should be 0 and the last element should be ``len(data)``.
+    ragged_axis: int (optional, default=0)
+        Which axis of the matrices that varies in length (0 or 1).
+    """
+    def __init__(self, data, offsets, ragged_axis=0):
+        offsets = np.asarray(offsets, dtype=int)
+        if data.ndim != 2:
+            raise ValueError(f'The data buffer must be two dimensional, not {data.ndim} dimensional.')
+        if offsets[0] != 0 or offsets[-1] != data.shape[0] or np.any(np.diff(offsets) < 0):
+            raise ValueError(
+                'The offsets must be non-decreasing, start at 0 and end at the number of rows of the data buffer.'
+            )
+        if ragged_axis not in (0, 1):
+            raise ValueError(f'`ragged_axis` must be either 0 or 1, not {ragged_axis}.')
+
+        self.data = data
+        self.offsets = offsets
+        self.ragged_axis = ragged_axis
+
+    @classmethod
+    def from_list(cls, matrices, ragged_axis=0, dtype=None):
+        """Copy a list of matrices into a single buffer.
+
+        Arguments:
+        ----------
+        matrices: list(np.ndarray(ndim=2))
+            The matrices to store. All matrices must have the same length along
+            the axis that is not ragged.
+        ragged_axis: int (optional, default=0)
+            Which axis of the matrices that varies in length (0 or 1).
+        dtype: np.dtype (optional, default=None)
+            Data type of the buffer. If None, then the dtype is inferred from the matrices.
+        """
+        if isinstance(matrices, cls) and matrices.ragged_axis == ragged_axis:
+            return matrices
+
+        matrices = [np.asarray(matrix) for matrix in matrices]
+        if ragged_axis == 1:
+            matrices = [matrix.T for matrix in matrices]
+
+        widths = {matrix.shape[1] for matrix in matrices}
+        if len(widths) != 1:
+            raise ValueError(
+                f'All matrices must have the same length along the axis that is not ragged, got {widths}.'
+            )
+        width, = widths
+
+        if dtype is None:
+            dtype = np.result_type(*matrices)
+        offsets = np.cumsum([0] + [matrix.shape[0] for matrix in matrices])
+        data = np.empty((offsets[-1], width), dtype=dtype)
+        for start, stop, matrix in zip(offsets[:-1], offsets[1:], matrices):
+            data[start:stop] = matrix
+
+        return cls(data, offsets, ragged_axis=ragged_axis)
+
+    @classmethod
+    def from_stacked(cls, stacked, ragged_axis=0):
+        """Store a stack of equally sized matrices.
+
+        The data is only copied if the stacked matrices do not already have
+        the memory layout of the buffer.
+
+        Arguments:
+        ----------
+        stacked: np.ndarray(ndim=3)
+            Array of shape (K, L, W), where ``stacked[k]`` is the kth matrix.
+        ragged_axis: int (optional, default=0)
+            Which axis of the matrices that would vary in length (0 or 1).
+        """
+        if ragged_axis == 1:
+            stacked = np.swapaxes(stacked, 1, 2)
+        K, L, W = stacked.shape
+        data = np.ascontiguousarray(stacked).reshape(K*L, W)
+        return cls(data, np.arange(K + 1)*L, ragged_axis=ragged_axis)
+
+    def stacked(self):
+        """View of the buffer as a three-way array, where the kth element along the first axis is the kth matrix.
+
+        Only possible if all matrices have the same shape.
+        """
+        if not self.all_same_size:
+            raise ValueError('Cannot stack matrices that are not of equal size.')
+        length = self.lengths[0] if len(self) > 0 else 0
+        stacked = self.data.reshape(len(self), length, self.width)
+        if self.ragged_axis == 1:
+            return stacked.transpose(0, 2, 1)
+        return stacked
+
+    @property
+    def lengths(self):
+        """The length of each matrix along the ragged axis.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def width(self):
+        """The length of the matrices along the axis that is not ragged.
+        """
+        return self.data.shape[1]
+
+    @property
+    def shapes(self):
+        if self.ragged_axis == 0:
+            return [(length, self.width) for length in self.lengths]
+        return [(self.width, length) for length in self.lengths]
+
+    @property
+    def all_same_size(self):
+        lengths = self.lengths
+        return bool(np.all(lengths == lengths[:1]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(f'Index {k} is out of bounds for RaggedArray with {len(self)} elements')
+
+        matrix = self.data[self.offsets[k]:self.offsets[k+1]]
+        if self.ragged_axis == 1:
+            return matrix.T
+        return matrix
+
+    def __setitem__(self, k, value):
+        self[k][...] = value
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def chunk(self, start, stop):
+        """View of the matrices ``start, start+1, ..., stop-1`` as a new ragged array.
+        """
+        offsets = self.offsets[start:stop+1]
+        return type(self)(self.data[offsets[0]:offsets[-1]], offsets - offsets[0], ragged_axis=self.ragged_axis)
+
+    def concatenate(self, other):
+        """New ragged array with the matrices of ``other`` placed after the matrices of this array.
+        """
+        if other.ragged_axis != self.ragged_axis:
+            raise ValueError('Cannot concatenate ragged arrays with different ragged axes.')
+        data = np.concatenate([self.data, other.data], axis=0)
+        offsets = np.concatenate([self.offsets, self.offsets[-1] + other.offsets[1:]])
+        return type(self)(data, offsets, ragged_axis=self.ragged_axis)
+
+    def take(self, indices):
+        """Copy the matrices with the given indices into a new ragged array.
+        """
+        return RaggedArray.from_list([self[k] for k in indices], ragged_axis=self.ragged_axis, dtype=self.data.dtype)
+
+    def copy(self):
+        return type(self)(self.data.copy(), self.offsets.copy(), ragged_axis=self.ragged_axis)
+
+    def norm(self):
+        """Frobenius norm of all matrices (as if they were stacked).
+        """
+        return np.linalg.norm(self.data)
+
+    def slice_sq_norms(self):
+        """The squared Frobenius norm of each matrix.
+        """
+        row_sq_norms = np.sum(self.data[:self.offsets[-1]]**2, axis=1)
+        slice_sq_norms = np.zeros(len(self.offsets) - 1, dtype=row_sq_norms.dtype)
+
+        # Each segment of reduceat ends where the next one starts, so the
+        # starts of empty matrices are skipped (their norm stays zero).
+        nonempty = self.lengths > 0
+        if np.any(nonempty):
+            slice_sq_norms[nonempty] = np.add.reduceat(row_sq_norms, self.offsets[:-1][nonempty])
+        return slice_sq_norms
+
+    def repeat(self, rows):
+        """Repeat the kth row of ``rows`` once for every row of the kth matrix in the buffer.
+
+        Useful for scaling all matrices with a separate vector, e.g.
+        ``ragged_array.data * ragged_array.repeat(C)``.
+        """
+        return np.repeat(rows, self.lengths, axis=0)
+
+    def store_in_hdf5_group(self, group, name):
+        """Store the buffer and offsets as two datasets, ``name`` and ``name_offsets``.
+        """
+        group[name] = self.data
+        group[f'{name}_offsets'] = self.offsets
+        group[name].attrs['ragged_axis'] = self.ragged_axis
+
+    @classmethod
+    def load_from_hdf5_group(cls, group, name):
+        data = group[name][...]
+        offsets = group[f'{name}_offsets'][...]
+        ragged_axis = int(group[name].attrs['ragged_axis'])
+        return cls(data, offsets, ragged_axis=ragged_axis)
+
+
+class LazyRaggedArray:
+    r"""Read-only sequence of matrices that are loaded on demand, e.g. from disk.
+
+    Has the same interface as :class:`RaggedArray` for the operations that do not
+    need all matrices in memory at once. Use ``chunk`` to load consecutive matrices
+    into an in-memory ``RaggedArray``, which makes it possible to stream through
+    datasets that are too large to fit in memory.
+
+    Arguments:
+    ----------
+    source: sequence
+        Object that supports ``len(source)`` and ``source[k]``, where ``source[k]``
+        is the kth matrix or an array-like object, such as a ``h5py.Dataset``, that
+        is read once it is converted to a NumPy array.
+    ragged_axis: int (optional, default=0)
+        Which axis of the matrices that varies in length (0 or 1).
+    shapes: list(tuple(int)) (optional, default=None)
+        The shape of each matrix. If None, then it is found with ``np.shape(source[k])``,
+        which loads the matrices if ``source[k]`` is not a lazy array-like object.
+    """
+    def __init__(self, source, ragged_axis=0, shapes=None):
+        if ragged_axis not in (0, 1):
+            raise ValueError(f'`ragged_axis` must be either 0 or 1, not {ragged_axis}.')
+        if shapes is None:
+            shapes = [np.shape(source[k]) for k in range(len(source))]
+        shapes = [tuple(shape) for shape in shapes]
+        if len(shapes) != len(source):
+            raise ValueError(f'Got {len(shapes)} shapes for {len(source)} matrices.')
+        if any(len(shape) != 2 for shape in shapes):
+            raise ValueError('All matrices must be two dimensional.')
+
+        widths = {shape[1 - ragged_axis] for shape in shapes}
+        if len(widths) > 1:
+            raise ValueError(
+                f'All matrices must have the same length along the axis that is not ragged, got {widths}.'
+            )
+
+        self.source = source
+        self.ragged_axis = ragged_axis
+        self.offsets = np.cumsum([0] + [shape[ragged_axis] for shape in shapes])
+        self._width = widths.pop() if widths else 0
+
+    @classmethod
+    def from_hdf5_group(cls, group, ragged_axis=0):
+        """Lazily read the matrices stored as separate datasets in a HDF5 group.
+
+        The datasets are ordered numerically if all names are integers and 
+        alphabetically otherwise. The file must stay open while the matrices 
+        are read.
+        """
+        names = list(group.keys())
+        if all(name.isdigit() for name in names):
+            names = sorted(names, key=int)
+        else:
+            names = sorted(names)
+        datasets = [group[name] for name in names]
+        return cls(datasets, ragged_axis=ragged_axis, shapes=[dataset.shape for dataset in datasets])
+
+    @property
+    def lengths(self):
+        """The length of each matrix along the ragged axis.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def width(self):
+        """The length of the matrices along the axis that is not ragged.
+        """
+        return self._width
+
+    @property
+    def shapes(self):
+        if self.ragged_axis == 0:
+            return [(length, self.width) for length in self.lengths]
+        return [(self.width, length) for length in self.lengths]
+
+    @property
+    def all_same_size(self):
+        lengths = self.lengths
+        return bool(np.all(lengths == lengths[:1]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        """Load the kth matrix.
+        """
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(f'Index {k} is out of bounds for LazyRaggedArray with {len(self)} elements')
+        return np.asarray(self.source[k])
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def chunk(self, start, stop, dtype=None):
+        """Load the matrices ``start, start+1, ..., stop-1`` into a ragged array.
+        """
+        return RaggedArray.from_list(
+            [self[k] for k in range(start, stop)], ragged_axis=self.ragged_axis, dtype=dtype
+        )
+
+    def take(self, indices, dtype=None):
+        """Load the matrices with the given indices into a ragged array.
+        """
+        return RaggedArray.from_list([self[k] for k in indices], ragged_axis=self.ragged_axis, dtype=dtype)
+
+    def load(self, dtype=None):
+        """Load all matrices into a ragged array.
+        """
+        return self.chunk(0, len(self), dtype=dtype)
+
+    def stacked(self):
+        """Load all matrices into a three-way array. Only possible if all matrices have the same shape.
+        """
+        return self.load().stacked()
+
+    def norm(self):
+        """Frobenius norm of all matrices (as if they were stacked), loading one matrix at the time.
+        """
+        return np.sqrt(np.sum(self.slice_sq_norms()))
+
+    def slice_sq_norms(self):
+        """The squared Frobenius norm of each matrix, loading one matrix at the time.
+        """
+        return np.array([np.linalg.norm(matrix)**2 for matrix in self])
+
+    def repeat(self, rows):
+        """Repeat the kth row of ``rows`` once for every row of the kth matrix.
+        """
+        return np.repeat(rows, self.lengths, axis=0)
@@ -1,7 +1,10 @@
+import itertools
+
 import pytest
 import numpy as np
 from tenkit import metrics
-from tenkit.decomposition.decompositions import Parafac2Tensor
+from tenkit import base
+from tenkit.decomposition.decompositions import KruskalTensor, Parafac2Tensor
 
 
 class TestCoreConsistency:
@@ -17,6 +20,126 @@ class TestCoreConsistency:
         B = random_parafac2_tensor.blueprint_B
         C = random_parafac2_tensor.C
         
-        cc = np.asscalar(metrics.core_consistency_parafac2(X, P, A, B, C))
+        cc = float(metrics.core_consistency_parafac2(X, P, A, B, C))
         assert abs(cc-100) < 1e-10
+
+    def test_four_way_core_consistency_perfect_decomposition(self):
+        ktensor = KruskalTensor.random_init((5, 6, 7, 8), rank=3)
+        ktensor.normalize_components()
+        assert abs(ktensor.core_consistency(ktensor.construct_tensor()) - 100) < 1e-10
+
+    def test_core_consistency_equals_kronecker_least_squares(self):
+        A, B, C = [np.random.standard_normal((size, 3)) for size in (6, 7, 8)]
+        X = np.einsum('ir,jr,kr->ijk', A, B, C) + 0.3*np.random.standard_normal((6, 7, 8))
+
+        scaled_factors, _ = zip(*(metrics.utils.normalize_factor(factor) for factor in (A, B, C)))
+        weights = np.prod([np.linalg.norm(factor, axis=0) for factor in (A, B, C)], axis=0)
+        scaled_factors = [factor*weights**(1/3) for factor in scaled_factors]
+        G = np.linalg.lstsq(base.kron(*scaled_factors), X.ravel(), rcond=None)[0]
+        T = np.zeros((3, 3, 3))
+        T[np.arange(3), np.arange(3), np.arange(3)] = 1
+
+        expected_cc = 100*(1 - np.sum((G - T.ravel())**2)/3)
+        assert np.isclose(metrics.core_consistency(X, A, B, C), expected_cc)
         
+
+
+class TestFactorMatchScore:
+    @pytest.mark.parametrize("fms_reduction", ["min", "mean"])
+    def test_equals_exhaustive_search(self, fms_reduction):
+        true_factors = [np.random.standard_normal((10, 4)) for _ in range(3)]
+        estimated_factors = [np.random.standard_normal((10, 5)) for _ in range(3)]
+        reduction = np.min if fms_reduction == "min" else np.mean
+
+        exhaustive_fms = max(
+            reduction(metrics._factor_match_score(true_factors, [f[:, permutation] for f in estimated_factors]))
+            for permutation in itertools.permutations(range(5), r=4)
+        )
+        fms, permutation = metrics.factor_match_score(true_factors, estimated_factors, fms_reduction=fms_reduction)
+        assert np.isclose(fms, exhaustive_fms)
+        assert np.isclose(
+            reduction(metrics._factor_match_score(true_factors, [f[:, permutation] for f in estimated_factors])),
+            fms
+        )
+
+    @pytest.mark.parametrize("fms_reduction", ["min", "mean"])
+    def test_finds_permutation_of_high_rank_model(self, fms_reduction):
+        factors = [np.random.standard_normal((30, 20)) for _ in range(3)]
+        permutation = np.random.permutation(20)
+        permuted_factors = [f[:, permutation] for f in factors]
+
+        fms, best_permutation = metrics.factor_match_score(factors, permuted_factors, fms_reduction=fms_reduction)
+        assert np.isclose(fms, 1)
+        assert np.array_equal(permutation[list(best_permutation)], np.arange(20))
+
+    def test_bottleneck_assignment_maximises_minimum_score(self):
+        scores = np.random.uniform(size=(6, 7))
+        best_minimum = max(
+            np.min(scores[np.arange(6), permutation]) for permutation in itertools.permutations(range(7), r=6)
+        )
+        columns = metrics._bottleneck_assignment(scores)
+        assert len(set(columns)) == 6
+        assert np.isclose(np.min(scores[np.arange(6), columns]), best_minimum)
+
+
+class TestPairwiseFactorMatchScore:
+    @pytest.fixture
+    def models(self):
+        solutions = [[np.random.standard_normal((10, 3)) for _ in range(3)] for _ in range(2)]
+        models = []
+        for solution in [0, 1, 0, 1, 0]:
+            permutation = np.random.permutation(3)
+            models.append([2*factor[:, permutation] for factor in solutions[solution]])
+        return models
+
+    @pytest.mark.parametrize("fms_reduction", ["min", "mean"])
+    def test_equals_factor_match_score(self, models, fms_reduction):
+        fms, permutations = metrics.pairwise_factor_match_score(models, fms_reduction=fms_reduction)
+        for i, model1 in enumerate(models):
+            for j, model2 in enumerate(models):
+                expected_fms, _ = metrics.factor_match_score(model1, model2, fms_reduction=fms_reduction)
+                assert np.isclose(fms[i, j], expected_fms)
+
+                permuted_model2 = [factor[:, permutations[i, j]] for factor in model2]
+                reduction = np.min if fms_reduction == "min" else np.mean
+                assert np.isclose(reduction(metrics._factor_match_score(model1, permuted_model2)), fms[i, j])
+
+    def test_cluster_solutions(self, models):
+        fms, _ = metrics.pairwise_factor_match_score(models)
+        labels, representatives = metrics.cluster_solutions(fms, losses=[5, 4, 3, 2, 1])
+        assert np.array_equal(labels, [0, 1, 0, 1, 0])
+        assert representatives == [4, 3]
+
+
+class TestLeverage:
+    def test_leverage_equals_hat_matrix_diagonal(self):
+        factor_matrix = np.random.standard_normal((20, 4))
+        hat_matrix = factor_matrix@np.linalg.inv(factor_matrix.T@factor_matrix)@factor_matrix.T
+        assert np.allclose(metrics.leverage(factor_matrix), np.diagonal(hat_matrix))
+
+    def test_kruskal_tensor_leverages(self):
+        ktensor = KruskalTensor.random_init((10, 11, 12), rank=3)
+        leverages = ktensor.leverages()
+        assert len(leverages) == len(ktensor.factor_matrices)
+        for factor_matrix, leverage in zip(ktensor.factor_matrices, leverages):
+            assert np.allclose(leverage, metrics.leverage(factor_matrix))
+            assert np.isclose(np.sum(leverage), 3)
+
+
+class TestKruskalTensorFit:
+    @pytest.mark.parametrize("chunk_size", [None, 3])
+    def test_evaluate_equals_reconstructed_fit(self, tmp_path, chunk_size):
+        X = np.random.standard_normal((10, 11, 12))
+        X_memmap = np.lib.format.open_memmap(tmp_path/'X.npy', mode='w+', shape=X.shape)
+        X_memmap[...] = X
+
+        fit_evaluator = metrics.KruskalTensorFit(X_memmap, chunk_size=chunk_size)
+        for _ in range(2):
+            ktensor = KruskalTensor.random_init(X.shape, rank=3)
+            ktensor.normalize_components()
+            SSE = np.linalg.norm(X - ktensor.construct_tensor())**2
+
+            scores = fit_evaluator.evaluate(ktensor)
+            assert np.isclose(scores['SSE'], SSE)
+            assert np.isclose(scores['fit'], 1 - np.sqrt(SSE)/np.linalg.norm(X))
+            assert np.isclose(scores['percent_explained'], metrics.percent_explained(X, ktensor.construct_tensor()))
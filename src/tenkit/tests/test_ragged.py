@@ -0,0 +1,111 @@
+import tempfile
+
+import h5py
+import pytest
+import numpy as np
+from tenkit.ragged import RaggedArray, LazyRaggedArray
+
+
+class TestRaggedArray:
+    @pytest.fixture
+    def matrices(self):
+        return [np.random.randn(np.random.randint(1, 20), 5) for _ in range(10)]
+
+    @pytest.fixture
+    def slices(self):
+        return [np.random.randn(5, np.random.randint(1, 20)) for _ in range(10)]
+
+    def test_from_list_gives_same_matrices(self, matrices):
+        ragged_array = RaggedArray.from_list(matrices)
+        assert len(ragged_array) == len(matrices)
+        for matrix, stored_matrix in zip(matrices, ragged_array):
+            assert matrix.shape == stored_matrix.shape
+            assert np.allclose(matrix, stored_matrix)
+
+    def test_transposed_from_list_gives_same_matrices(self, slices):
+        ragged_array = RaggedArray.from_list(slices, ragged_axis=1)
+        assert ragged_array.shapes == [slice_.shape for slice_ in slices]
+        for slice_, stored_slice in zip(slices, ragged_array):
+            assert np.allclose(slice_, stored_slice)
+
+    def test_items_are_views(self, slices):
+        ragged_array = RaggedArray.from_list(slices, ragged_axis=1)
+        ragged_array[3][...] = 0
+        assert np.all(ragged_array[3] == 0)
+        assert np.shares_memory(ragged_array[3], ragged_array.data)
+
+    def test_norms(self, matrices):
+        ragged_array = RaggedArray.from_list(matrices)
+        assert np.allclose(ragged_array.norm()**2, sum(np.linalg.norm(m)**2 for m in matrices))
+        assert np.allclose(ragged_array.slice_sq_norms(), [np.linalg.norm(m)**2 for m in matrices])
+
+    def test_empty_matrix_has_zero_norm(self):
+        ragged_array = RaggedArray.from_list([np.ones((2, 3)), np.ones((0, 3)), np.ones((1, 3))])
+        assert np.allclose(ragged_array.slice_sq_norms(), [6, 0, 3])
+
+    def test_slice_sq_norms_of_tiny_matrix_after_large_matrix(self):
+        ragged_array = RaggedArray.from_list([
+            np.full((5, 2), 1e8), np.full((1, 2), 1e-4), np.ones((0, 2)), np.full((2, 2), 1e-4)
+        ])
+        slice_sq_norms = ragged_array.slice_sq_norms()
+        assert np.allclose(slice_sq_norms, [1e17, 2e-8, 0, 4e-8], rtol=1e-12, atol=0)
+
+    def test_store_and_load(self, slices):
+        ragged_array = RaggedArray.from_list(slices, ragged_axis=1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with h5py.File(f'{tmpdir}/ragged.h5', 'w') as h5:
+                ragged_array.store_in_hdf5_group(h5, 'X')
+            with h5py.File(f'{tmpdir}/ragged.h5', 'r') as h5:
+                loaded = RaggedArray.load_from_hdf5_group(h5, 'X')
+
+        assert loaded.ragged_axis == 1
+        for slice_, loaded_slice in zip(slices, loaded):
+            assert np.allclose(slice_, loaded_slice)
+
+    def test_different_widths_raises(self):
+        with pytest.raises(ValueError):
+            RaggedArray.from_list([np.ones((2, 3)), np.ones((2, 4))])
+
+    def test_stacked_is_view_of_stacked_matrices(self):
+        stacked = np.random.randn(10, 5, 7)
+        for ragged_axis in [0, 1]:
+            ragged_array = RaggedArray.from_stacked(stacked, ragged_axis=ragged_axis)
+            assert ragged_array.shapes == [(5, 7)]*10
+            for matrix, stored_matrix in zip(stacked, ragged_array):
+                assert np.allclose(matrix, stored_matrix)
+
+            assert np.allclose(ragged_array.stacked(), stacked)
+            assert np.shares_memory(ragged_array.stacked(), ragged_array.data)
+
+    def test_irregular_matrices_cannot_be_stacked(self, matrices):
+        matrices[0] = np.random.randn(matrices[1].shape[0] + 1, 5)
+        with pytest.raises(ValueError):
+            RaggedArray.from_list(matrices).stacked()
+
+
+class TestLazyRaggedArray:
+    @pytest.fixture
+    def slices(self):
+        return [np.random.randn(5, np.random.randint(1, 20)) for _ in range(10)]
+
+    def test_chunk_loads_same_matrices(self, slices):
+        lazy_array = LazyRaggedArray(slices, ragged_axis=1)
+        ragged_array = RaggedArray.from_list(slices, ragged_axis=1)
+        assert lazy_array.shapes == ragged_array.shapes
+        assert np.array_equal(lazy_array.offsets, ragged_array.offsets)
+
+        chunk = lazy_array.chunk(2, 6)
+        assert isinstance(chunk, RaggedArray)
+        for slice_, loaded_slice in zip(slices[2:6], chunk):
+            assert np.allclose(slice_, loaded_slice)
+        assert np.allclose(lazy_array.norm(), ragged_array.norm())
+
+    def test_from_hdf5_group_orders_datasets_numerically(self, slices):
+        with tempfile.TemporaryFile() as f, h5py.File(f, 'w') as h5:
+            for k, slice_ in enumerate(slices):
+                h5[str(k)] = slice_
+
+            lazy_array = LazyRaggedArray.from_hdf5_group(h5, ragged_axis=1)
+            assert len(lazy_array) == len(slices)
+            for slice_, loaded_slice in zip(slices, lazy_array):
+                assert np.allclose(slice_, loaded_slice)
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.linalg
 from copy import deepcopy
 from . import base
 
@@ -27,6 +28,20 @@ def get_pca_loadings(Y, rank):
     return A
 
 
+def get_symmetric_pca_loadings(Y, rank):
+    """Returns the pca loadings of the symmetric positive semidefinite Y matrix.
+
+    Equivalent to ``get_pca_loadings(Y, rank)`` (up to sign), but only the 
+    ``rank`` leading eigenvectors of Y are computed.
+    """
+    if rank > Y.shape[0]:
+        raise ValueError(f'Cannot compute {rank} loadings of a {Y.shape[0]}x{Y.shape[0]} matrix.')
+    num_rows = Y.shape[0]
+    eigenvalues, eigenvectors = scipy.linalg.eigh(Y, subset_by_index=[num_rows - rank, num_rows - 1])
+    # eigh returns the eigenvalues in ascending order
+    return (eigenvectors*eigenvalues)[:, ::-1]
+
+
 
 
 def create_random_factors(sizes, rank):